@@ -163,6 +163,8 @@ class ObjectDetectionHandler (
         val rawData = input.body ?: "{}"
         var imageBytes: ByteArray = ByteArray(0)
         var detections: List<BoundingBox> = emptyList()
+        // Optional client frame id, echoed back so clients can pipeline frames
+        var frameId: Any? = null
 
         
         val domainName = input.requestContext.domainName
@@ -209,6 +211,7 @@ class ObjectDetectionHandler (
             logger.log("Parsing JSON body...")
             val jsonMap = mapper.readValue(rawData, Map::class.java)
             val imageBase64 = jsonMap["body"] as? String ?: ""
+            frameId = jsonMap["frameId"]?.takeIf { it is String || it is Number }
             logger.log("Base64 string length: ${imageBase64.length}")
 
             if (imageBase64.isNotEmpty()) {
@@ -259,11 +262,12 @@ class ObjectDetectionHandler (
                 )
             }
 
-            val responsePayload = mapOf(
+            val responsePayload = mutableMapOf<String, Any>(
                 "frameSize" to imageBytes.size,
                 "valid" to validImage,
                 "estimatedDistances" to distancesList
             )
+            frameId?.let { responsePayload["frameId"] = it }
 
             val responseMessage = mapper.writeValueAsString(responsePayload)
             logger.log("Sending response: $responseMessage")
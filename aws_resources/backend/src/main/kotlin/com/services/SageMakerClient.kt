@@ -11,6 +11,7 @@ import software.amazon.awssdk.services.sagemakerruntime.model.InvokeEndpointRequ
 import software.amazon.awssdk.http.urlconnection.UrlConnectionHttpClient
 import com.fasterxml.jackson.module.kotlin.jacksonObjectMapper
 import com.fasterxml.jackson.module.kotlin.readValue
+import com.fasterxml.jackson.annotation.JsonIgnoreProperties
 import com.fasterxml.jackson.annotation.JsonProperty
 import java.time.Duration
 
@@ -23,6 +24,9 @@ object SageMakerClient {
     private val mapper = jacksonObjectMapper()
     private var client: SageMakerRuntimeClient? = null
     private var endpointName: String? = null
+
+    // Optional NMS options forwarded to the container, e.g. "conf=0.4;classes=person,chair;max_det=20"
+    private var customAttributes: String? = null
     
     /**
      * Initialize the SageMaker client
@@ -34,6 +38,7 @@ object SageMakerClient {
                 ?: throw IllegalStateException("SAGEMAKER_ENDPOINT_NAME environment variable not set")
             
             val region = System.getenv("AWS_REGION_SAGEMAKER") ?: "us-east-1"
+            customAttributes = System.getenv("SAGEMAKER_CUSTOM_ATTRIBUTES")?.takeIf { it.isNotBlank() }
             
             client = SageMakerRuntimeClient.builder()
                 .region(Region.of(region))
@@ -79,18 +84,22 @@ object SageMakerClient {
             }
             
             // Create SageMaker request
-            val request = InvokeEndpointRequest.builder()
+            val requestBuilder = InvokeEndpointRequest.builder()
                 .endpointName(endpointName)
                 .contentType(contentType)
                 .accept("application/json")
                 .body(SdkBytes.fromByteArray(imageBytes))
-                .build()
+            customAttributes?.let { requestBuilder.customAttributes(it) }
+            val request = requestBuilder.build()
             
             // Call SageMaker endpoint
             val response = client!!.invokeEndpoint(request)
             val responseBody = response.body().asUtf8String()
             
             val inferenceTime = System.currentTimeMillis() - startTime
+
+            // Per-stage timings measured inside the container (decode, forward, nms, ...)
+            response.customAttributes()?.let { println("SageMaker $it (round trip ${inferenceTime}ms)") }
             
             // Parse response (Ultralytics format)
             val sagemakerResponse = mapper.readValue<SageMakerResponse>(responseBody)
@@ -149,7 +158,9 @@ object SageMakerClient {
 
 /**
  * Data classes for parsing SageMaker response (Ultralytics format)
+ * Unknown fields (e.g. "reused" for session requests) are ignored.
  */
+@JsonIgnoreProperties(ignoreUnknown = true)
 private data class SageMakerResponse(
     val success: Boolean,
     val predictions: List<Prediction>,
@@ -157,12 +168,14 @@ private data class SageMakerResponse(
     val error: String? = null
 )
 
+@JsonIgnoreProperties(ignoreUnknown = true)
 private data class Prediction(
     @JsonProperty("class") val className: String,
     val confidence: Float,
     val box: Box
 )
 
+@JsonIgnoreProperties(ignoreUnknown = true)
 private data class Box(
     val x1: Int,
     val y1: Int,
@@ -170,6 +183,7 @@ private data class Box(
     val y2: Int
 )
 
+@JsonIgnoreProperties(ignoreUnknown = true)
 private data class ImageInfo(
     val width: Int,
     val height: Int
@@ -105,4 +105,28 @@ class ObjectDetectionHandlerTest {
         // Distance Formula: (RealHeight(1.7) * Focal(800)) / PixelHeight(640) = 2.125
         assertTrue(resultJson.contains("2.125"), "Expected distance 2.125 not found in response")
     }
-}
\ No newline at end of file
+
+    @Test
+    fun `handleRequest should echo the client frameId`() {
+        every { mockHeightDdb.scanAll() } returns emptyList()
+        every { mockFeatureDdb.getStringItem(itemName = "enable_sagemaker_inference") } returns false
+
+        val base64Image = Base64.getEncoder().encodeToString("fake_image_bytes".toByteArray())
+        val event = APIGatewayV2WebSocketEvent().apply {
+            requestContext = RequestContext().apply {
+                connectionId = "test-conn-id"
+                domainName = "test.api"
+                stage = "prod"
+            }
+            body = """{"action":"frame", "frameId":42, "body":"$base64Image"}"""
+        }
+
+        handler.handleRequest(event, mockContext)
+
+        val apiSlot = slot<PostToConnectionRequest>()
+        verify { mockApiGateway.postToConnection(capture(apiSlot)) }
+
+        val resultJson = apiSlot.captured.data().asUtf8String()
+        assertTrue(resultJson.contains("\"frameId\":42"), "Expected frameId 42 echoed in response: $resultJson")
+    }
+}
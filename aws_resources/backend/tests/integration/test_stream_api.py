@@ -153,4 +153,20 @@ def test_dataflow(api_base_url):
     finally:
         # Always close connection, even if test fails
         ws.close()
-        print("🔌 Connection Closed")
\ No newline at end of file
+        print("🔌 Connection Closed")
+
+def test_frame_ids_pipelined(api_base_url):
+    """Frames sent back to back are answered with their own frameId, in any order"""
+    ws = create_connection(api_base_url)
+    try:
+        with open(IMAGE_PATH, "rb") as f:
+            img_str = base64.b64encode(f.read()).decode('utf-8')
+
+        for frame_id in (1, 2, 3):
+            ws.send(json.dumps({"action": "frame", "frameId": frame_id, "body": img_str}))
+        responses = [json.loads(ws.recv()) for _ in range(3)]
+
+        assert sorted(r.get("frameId") for r in responses) == [1, 2, 3]
+        assert all(r.get("valid") is True for r in responses)
+    finally:
+        ws.close()
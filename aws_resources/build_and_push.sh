@@ -35,6 +35,8 @@ echo "============================================"
 echo "Step 2: Building Docker Image"
 echo "============================================"
 cd sagemaker
+# Stage INT8 calibration frames into the Docker build context
+rm -rf calibration && cp -r ../backend/tests/integration/resized calibration
 docker build -t $IMAGE_NAME:$TAG .
 echo "✅ Docker image built successfully"
 echo ""
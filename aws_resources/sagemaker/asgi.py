@@ -0,0 +1,53 @@
+"""
+ASGI entry point (Starlette) for Gunicorn's Uvicorn worker
+Same /ping, /invocations and /metrics contract as wsgi.py, but request
+bodies are read on the event loop so slow uploads do not hold a thread, and
+the loop awaits the inference pipeline's future instead of blocking a thread on it
+"""
+
+import asyncio
+
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route
+
+import inference
+from encoding import encode_json
+from metrics import REGISTRY, StageTimer
+from options import collect_params
+
+
+def _json_response(content, status):
+    return Response(content, status_code=status, media_type='application/json')
+
+
+async def ping(request):
+    body, status = inference.health()
+    return _json_response(encode_json(body), status)
+
+
+async def invocations(request):
+    timer = StageTimer()
+    # Body is streamed in on the event loop; no thread is pinned while a slow client uploads
+    with timer.stage('read'):
+        image_bytes = await request.body()
+    content_type = request.headers.get('content-type')
+    params = collect_params(request.query_params, request.headers)
+
+    # Decode, inference and encoding run in the pipeline's stages (see
+    # pipeline.py); a full decode queue is answered with 429 straight away
+    content, status, headers = await asyncio.wrap_future(inference.submit_invocation(
+        content_type, image_bytes, timer, params, request.headers.get('accept')
+    ))
+    return Response(content, status_code=status, headers=headers)
+
+
+async def metrics(request):
+    return Response(REGISTRY.render(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+app = Starlette(routes=[
+    Route('/ping', ping, methods=['GET']),
+    Route('/invocations', invocations, methods=['POST']),
+    Route('/metrics', metrics, methods=['GET']),
+])
@@ -0,0 +1,271 @@
+"""
+Serving autotuner: finds the fastest settings for the machine it runs on
+
+Run on the instance type you deploy to:
+
+  python -m inference autotune
+  python -m inference autotune --backends torch,onnxruntime --max-p95-ms 150 --output serving_profile.json
+
+Each candidate configuration is measured with fresh processes (one per
+gunicorn worker it would run), each driving the full /invocations path
+in-process from as many client threads as the worker would have gunicorn
+threads. Frames are the bundled integration images plus synthetic ones
+(inside the container, pass --images-dir /opt/program/calibration).
+
+The search is greedy, one knob group at a time (backend, workers and torch
+threads, gunicorn threads, batch size, batch window, input size), keeping
+the best value of each before moving on. The best configuration is the one
+with the highest throughput whose p95 latency stays within --max-p95-ms
+(or the lowest p95 if none does). It is written as a serving profile (see
+settings.py); bake it into the image as /opt/program/serving_profile.json
+or point SERVING_PROFILE at it.
+
+Input size and INT8 precision change accuracy, so only the sizes passed
+with --sizes are tried and precision is left alone.
+"""
+
+import os
+import sys
+import json
+import platform
+import subprocess
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+SCRIPT_DIR = Path(__file__).parent.absolute()
+DEFAULT_IMAGES_DIR = SCRIPT_DIR.parent / "backend" / "tests" / "integration" / "resized"
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+
+_cpu_count = os.cpu_count() or 1
+
+
+def add_arguments(parser):
+    parser.add_argument('--model', default=os.environ.get('MODEL_PATH', '/opt/program/yolo11n.pt'),
+                        help='Path to model weights (exported backends are looked up next to it)')
+    parser.add_argument('--images-dir', default=str(DEFAULT_IMAGES_DIR),
+                        help='Directory of test images (default: bundled integration images)')
+    parser.add_argument('--synthetic', type=int, default=8, help='Synthetic frames added to the images')
+    parser.add_argument('--requests', type=int, default=64, help='Requests per worker per configuration')
+    parser.add_argument('--max-p95-ms', type=float, default=250.0, help='p95 latency budget')
+    parser.add_argument('--backends', default='torch,onnxruntime,openvino',
+                        help='Comma-separated backends to try (missing exports are skipped)')
+    parser.add_argument('--workers', default=None,
+                        help='Comma-separated worker counts (default: 1, 2, 4... up to the core count)')
+    parser.add_argument('--threads', default='2,4,8', help='Comma-separated gunicorn threads per worker')
+    parser.add_argument('--batch-sizes', default='1,4,8', help='Comma-separated max batch sizes')
+    parser.add_argument('--wait-ms', default='0,5', help='Comma-separated batch windows (ms)')
+    parser.add_argument('--sizes', default='640', help='Comma-separated input sizes to try')
+    parser.add_argument('--output', default='serving_profile.json', help='Profile file to write')
+
+
+def _parse_list(value, cast=str):
+    return [cast(v.strip()) for v in value.split(',') if v.strip()]
+
+
+def load_payloads(images_dir, synthetic):
+    """JPEG request bodies: every bundled image plus synthetic frames of phone-camera shapes"""
+    payloads = []
+    images_dir = Path(images_dir)
+    if images_dir.is_dir():
+        for path in sorted(images_dir.iterdir()):
+            if path.suffix.lower() in IMAGE_EXTENSIONS:
+                payloads.append(path.read_bytes())
+    rng = np.random.default_rng(0)
+    for i in range(synthetic):
+        height, width = (1280, 720) if i % 2 == 0 else (720, 1280)
+        # Smooth gradients with noise compress like camera frames, unlike pure noise
+        gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+        frame = gradient + rng.normal(0, 20, (height, width, 3))
+        ok, encoded = cv2.imencode('.jpg', np.clip(frame, 0, 255).astype(np.uint8))
+        if ok:
+            payloads.append(encoded.tobytes())
+    if not payloads:
+        raise RuntimeError(f"No frames to measure with (no images in {images_dir} and --synthetic 0)")
+    return payloads
+
+
+def _measure(settings, args):
+    """
+    Run one configuration: start MODEL_SERVER_WORKERS measuring processes,
+    release them together once all have warmed up, and pool their results.
+    Returns {'fps', 'p50_ms', 'p95_ms'}, or None if it failed or any
+    request errored.
+    """
+    from benchmark import percentile
+
+    env = os.environ.copy()
+    env.update({key: str(value) for key, value in settings.items()})
+    env.update({
+        'MODEL_PATH': str(args.model),
+        'IMGSZ_LADDER': str(settings['MODEL_IMGSZ']),
+        'QUEUE_MAX_SIZE': '0',
+        'WARMUP_BATCH_SIZES': f"1,{settings['BATCH_MAX_SIZE']}",
+        # The per-worker budget gunicorn's post_fork gives ONNX Runtime / OpenVINO
+        'INFERENCE_THREADS': str(settings['TORCH_THREADS_PER_WORKER']),
+        # Measure exactly these settings, not an existing profile's
+        'SERVING_PROFILE': '',
+    })
+    command = [sys.executable, str(Path(__file__).absolute()), '--worker',
+               '--images-dir', str(args.images_dir), '--synthetic', str(args.synthetic),
+               '--requests', str(args.requests)]
+
+    workers = [subprocess.Popen(command, env=env, cwd=str(SCRIPT_DIR), text=True,
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+               for _ in range(int(settings['MODEL_SERVER_WORKERS']))]
+    try:
+        for worker in workers:
+            # Model loading and warm-up logs come first; wait for the ready marker
+            for line in worker.stdout:
+                if line.strip() == 'ready':
+                    break
+            else:
+                return None
+        for worker in workers:
+            worker.stdin.write('go\n')
+            worker.stdin.flush()
+
+        walls, latencies, errors = [], [], 0
+        for worker in workers:
+            result = None
+            for line in worker.stdout:
+                if line.startswith('result '):
+                    result = json.loads(line[len('result '):])
+            if worker.wait() != 0 or result is None:
+                return None
+            walls.append(result['wall'])
+            latencies.extend(result['latencies'])
+            errors += result['errors']
+        if errors:
+            return None
+    finally:
+        for worker in workers:
+            if worker.poll() is None:
+                worker.kill()
+
+    latencies.sort()
+    return {
+        'fps': round(len(latencies) / max(walls), 2),
+        'p50_ms': round(percentile(latencies, 50), 1),
+        'p95_ms': round(percentile(latencies, 95), 1),
+    }
+
+
+def _better(candidate, incumbent, max_p95_ms):
+    """Within budget beats over budget; then higher fps (or lower p95 when both are over)"""
+    if incumbent is None:
+        return True
+    fits, best_fits = candidate['p95_ms'] <= max_p95_ms, incumbent['p95_ms'] <= max_p95_ms
+    if fits != best_fits:
+        return fits
+    if fits:
+        return candidate['fps'] > incumbent['fps']
+    return candidate['p95_ms'] < incumbent['p95_ms']
+
+
+def tune(args, resolve_model_path):
+    """Greedy search over the serving knobs; writes the winning profile to args.output"""
+    from settings import write_profile
+
+    backends = [b for b in _parse_list(args.backends)
+                if os.path.exists(resolve_model_path(b, 'fp32', str(args.model)))]
+    if not backends:
+        print(f"No model found for backends {args.backends} next to {args.model}")
+        return 1
+    if args.workers:
+        worker_counts = _parse_list(args.workers, int)
+    else:
+        worker_counts = [w for w in (1, 2, 4, 8, 16) if w <= _cpu_count]
+
+    stages = [
+        [{'INFERENCE_BACKEND': b} for b in backends],
+        [{'MODEL_SERVER_WORKERS': w, 'TORCH_THREADS_PER_WORKER': max(1, _cpu_count // w)} for w in worker_counts],
+        [{'GUNICORN_THREADS': t} for t in _parse_list(args.threads, int)],
+        [{'BATCH_MAX_SIZE': b} for b in _parse_list(args.batch_sizes, int)],
+        [{'BATCH_MAX_WAIT_MS': w} for w in _parse_list(args.wait_ms, float)],
+        [{'MODEL_IMGSZ': s} for s in _parse_list(args.sizes, int)],
+    ]
+    # Start from the stock defaults (see inference.py, gunicorn.conf.py and serve)
+    best = {
+        'INFERENCE_BACKEND': backends[0],
+        'MODEL_SERVER_WORKERS': 1,
+        'TORCH_THREADS_PER_WORKER': _cpu_count,
+        'GUNICORN_THREADS': 4,
+        'BATCH_MAX_SIZE': 8,
+        'BATCH_MAX_WAIT_MS': 5.0,
+        'MODEL_IMGSZ': _parse_list(args.sizes, int)[0],
+    }
+    best_result = None
+    measured = {}
+
+    print(f"Cores: {_cpu_count}  Requests/worker: {args.requests}  p95 budget: {args.max_p95_ms:.0f}ms")
+    print(f"{'backend':<12} {'workers':>7} {'torch':>5} {'threads':>7} {'batch':>5} {'wait_ms':>7} "
+          f"{'imgsz':>5} {'fps':>8} {'p50_ms':>8} {'p95_ms':>8}")
+    for stage in stages:
+        for change in stage:
+            candidate = dict(best, **change)
+            key = tuple(sorted(candidate.items()))
+            if key not in measured:
+                measured[key] = _measure(candidate, args)
+                result = measured[key]
+                row = (f"{candidate['INFERENCE_BACKEND']:<12} {candidate['MODEL_SERVER_WORKERS']:>7} "
+                       f"{candidate['TORCH_THREADS_PER_WORKER']:>5} {candidate['GUNICORN_THREADS']:>7} "
+                       f"{candidate['BATCH_MAX_SIZE']:>5} {candidate['BATCH_MAX_WAIT_MS']:>7.1f} "
+                       f"{candidate['MODEL_IMGSZ']:>5}")
+                if result is None:
+                    print(f"{row} {'failed':>8}")
+                else:
+                    print(f"{row} {result['fps']:>8.2f} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f}")
+            result = measured[key]
+            if result is not None and _better(result, best_result, args.max_p95_ms):
+                best, best_result = candidate, result
+
+    if best_result is None:
+        print("Every configuration failed; no profile written")
+        return 1
+
+    best['IMGSZ_LADDER'] = best['MODEL_IMGSZ']
+    host = {'cpu_count': _cpu_count, 'machine': platform.machine(), 'processor': platform.processor()}
+    write_profile(args.output, best, measured=best_result, host=host)
+    print(f"Best: {best_result['fps']:.2f} fps, p95 {best_result['p95_ms']:.1f}ms -> {args.output}")
+    return 0
+
+
+def _worker(argv):
+    """One measuring process: load the model, report ready, run the closed loop on 'go'"""
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--worker', action='store_true')
+    parser.add_argument('--images-dir')
+    parser.add_argument('--synthetic', type=int)
+    parser.add_argument('--requests', type=int)
+    args = parser.parse_args(argv)
+
+    try:
+        import torch
+        torch.set_num_threads(int(os.environ.get('TORCH_THREADS_PER_WORKER', _cpu_count)))
+    except ImportError:
+        pass
+
+    sys.path.insert(0, str(SCRIPT_DIR))
+    from benchmark import load_inference, run_closed_loop
+    inference = load_inference(os.environ['MODEL_PATH'])
+    payloads = load_payloads(args.images_dir, args.synthetic)
+    concurrency = int(os.environ.get('GUNICORN_THREADS', '4'))
+    errors = []
+
+    def submit(payload):
+        _, status, _ = inference.handle_invocation('image/jpeg', payload)
+        if status != 200:
+            errors.append(status)
+
+    print('ready', flush=True)
+    sys.stdin.readline()
+    wall, latencies = run_closed_loop(submit, payloads, concurrency, args.requests)
+    print('result ' + json.dumps({'wall': wall, 'latencies': latencies, 'errors': len(errors)}), flush=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(_worker(sys.argv[1:]))
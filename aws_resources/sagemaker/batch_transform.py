@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Offline batch transform: run the detector over a directory, tar archive or
+glob of images and write one JSON line per image
+
+Each line is the /invocations JSON response for that image plus a "source"
+field naming it, in input order. Unreadable images get a
+{"success": false, "error": ...} line instead of stopping the run.
+
+The work is pipelined so the model is never waiting on I/O:
+  reader        lists files / streams tar members
+  decode pool   decodes and letterboxes in worker processes
+  prefetch      a bounded window of decoded frames ahead of the model
+  model         batched forward passes on the main thread
+  writer        serializes and writes lines on its own thread
+
+Usage:
+  python batch_transform.py walkthrough/ --output walkthrough.jsonl
+  python batch_transform.py recordings.tar.gz 'extra/**/*.jpg' --output - --batch-size 32 --conf 0.4
+"""
+
+import os
+import sys
+import glob
+import time
+import queue
+import tarfile
+import argparse
+import threading
+import contextlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).parent.absolute()
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+
+
+def iter_sources(inputs):
+    """
+    Yield (name, path, data) for every image in the inputs
+    Files are passed by path so the decode workers read them; tar members
+    are read here, since an archive stream cannot be shared across processes.
+    """
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            for file in sorted(p for p in path.rglob('*') if p.suffix.lower() in IMAGE_EXTENSIONS):
+                yield str(file), str(file), None
+        elif path.is_file() and item.lower().endswith(TAR_SUFFIXES):
+            with tarfile.open(item, 'r:*') as archive:
+                for member in archive:
+                    if member.isfile() and Path(member.name).suffix.lower() in IMAGE_EXTENSIONS:
+                        yield f"{item}/{member.name}", None, archive.extractfile(member).read()
+        elif path.is_file():
+            yield str(path), str(path), None
+        else:
+            matches = sorted(glob.glob(item, recursive=True))
+            if not matches:
+                print(f"Warning: no images match {item}", file=sys.stderr)
+            for match in matches:
+                if Path(match).suffix.lower() in IMAGE_EXTENSIONS:
+                    yield match, match, None
+
+
+def decode_task(task, imgsz):
+    """Worker-process side: (name, LetterboxedFrame or None, error or None)"""
+    from decode import decode_image, letterbox
+    name, path, data = task
+    try:
+        if data is None:
+            with open(path, 'rb') as f:
+                data = f.read()
+        image, original_size = decode_image(data, imgsz)
+        return name, letterbox(image, original_size, imgsz), None
+    except (OSError, ValueError) as e:
+        return name, None, str(e)
+
+
+def decoded_frames(sources, executor, imgsz, prefetch):
+    """Decode in the pool with at most `prefetch` frames in flight, yielding in input order"""
+    pending = deque()
+    for task in sources:
+        pending.append(executor.submit(decode_task, task, imgsz))
+        if len(pending) >= prefetch:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def batched(frames, batch_size):
+    batch = []
+    for item in frames:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class JsonlWriter:
+    """Serializes results and writes them on a background thread"""
+
+    def __init__(self, output, class_names):
+        self.class_names = class_names
+        self._file = sys.stdout.buffer if output == '-' else open(output, 'wb')
+        self._queue = queue.Queue(maxsize=256)
+        self._thread = threading.Thread(target=self._run, name="jsonl-writer", daemon=True)
+        self._thread.start()
+        self.error = None
+
+    def write(self, body, detections):
+        self._queue.put((body, detections))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        if self._file is not sys.stdout.buffer:
+            self._file.close()
+        else:
+            self._file.flush()
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        from encoding import encode
+        while True:
+            entry = self._queue.get()
+            if entry is None:
+                return
+            if self.error is not None:
+                continue
+            try:
+                body, detections = entry
+                self._file.write(encode(body, detections, self.class_names) + b'\n')
+            except Exception as e:
+                self.error = e
+
+
+def load_model(model_path):
+    """Import inference.py with the given weights and wait for its warm-up"""
+    if model_path:
+        os.environ['MODEL_PATH'] = str(model_path)
+    # One-off run: no need to warm up every batch size of the serving config
+    os.environ.setdefault('WARMUP_ITERATIONS', '0')
+    sys.path.insert(0, str(SCRIPT_DIR))
+    # Keep server logs off stdout, which may be the JSONL output
+    with contextlib.redirect_stdout(sys.stderr):
+        import inference
+    if inference.model is None:
+        raise RuntimeError(f"Model failed to load from {inference.MODEL_PATH}")
+    inference.ready.wait()
+    return inference
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run YOLOv11 detection over image directories, archives or globs')
+    parser.add_argument('inputs', nargs='+', help='Directories, .tar[.gz] archives, image files or glob patterns')
+    parser.add_argument('--output', '-o', required=True, help='JSONL output file, or - for stdout')
+    parser.add_argument('--model', default=None, help='Model weights (default: MODEL_PATH or /opt/program/yolo11n.pt)')
+    parser.add_argument('--batch-size', type=int, default=16, help='Images per forward pass')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Decode processes')
+    parser.add_argument('--prefetch', type=int, default=None, help='Decoded frames kept ahead of the model (default: 4 batches)')
+    parser.add_argument('--imgsz', type=int, default=None, help='Model input size (default: MODEL_IMGSZ)')
+    parser.add_argument('--conf', default=None, help='Confidence threshold')
+    parser.add_argument('--iou', default=None, help='NMS IoU threshold')
+    parser.add_argument('--classes', default=None, help='Comma-separated class names or ids to keep')
+    parser.add_argument('--max-det', default=None, help='Maximum detections per image')
+    args = parser.parse_args()
+
+    inference = load_model(args.model)
+    from decode import scale_to_original
+    from options import parse_options
+
+    params = {key: value for key, value in (('conf', args.conf), ('iou', args.iou),
+                                            ('classes', args.classes), ('max_det', args.max_det))
+              if value is not None}
+    try:
+        options = parse_options(params, inference.class_ids)
+    except ValueError as e:
+        parser.error(str(e))
+    imgsz = args.imgsz or inference.MODEL_IMGSZ
+    prefetch = args.prefetch or args.batch_size * 4
+
+    writer = JsonlWriter(args.output, inference.class_names)
+    images = errors = batches = 0
+    start = time.perf_counter()
+    # spawn: the parent already runs torch threads, which do not survive fork()
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=get_context('spawn')) as executor:
+        frames = decoded_frames(iter_sources(args.inputs), executor, imgsz, prefetch)
+        for batch in batched(frames, args.batch_size):
+            ok = [(name, frame) for name, frame, error in batch if error is None]
+            outputs = iter(inference.run_batch([(frame.image, options) for _, frame in ok])) if ok else iter(())
+            for name, frame, error in batch:
+                if error is not None:
+                    writer.write({"success": False, "error": f"Invalid image format: {error}", "source": name}, None)
+                    errors += 1
+                    continue
+                detections, _ = next(outputs)
+                body = {
+                    "success": True,
+                    "image": {"width": frame.width, "height": frame.height},
+                    "source": name,
+                }
+                writer.write(body, scale_to_original(detections, frame))
+            images += len(batch)
+            batches += 1
+            if batches % 20 == 0:
+                elapsed = time.perf_counter() - start
+                print(f"{images} images, {images / elapsed:.1f} img/s", file=sys.stderr)
+    writer.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Done: {images} images ({errors} failed) in {elapsed:.1f}s, "
+          f"{images / elapsed if elapsed else 0:.1f} img/s -> {args.output}", file=sys.stderr)
+    return 0 if images else 1
+
+
+if __name__ == "__main__":
+    exit(main())
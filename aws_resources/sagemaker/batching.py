@@ -0,0 +1,244 @@
+"""
+Dynamic micro-batching for the inference server
+Collects frames that arrive within a short window and runs them through the
+model as a single batched call, then hands each result back to its caller
+
+Admission control: the queue can be bounded, and items can carry a deadline.
+Items are refused up front when the queue is full or the predicted wait
+already overshoots their deadline, and dropped at dequeue if they expired
+while waiting, so overload sheds stale frames instead of running them.
+
+Items can also carry a key (a client session): a newer item with the same
+key supersedes one still waiting in the queue, so a burst from one client
+costs at most one model slot. Keys only meet within one batcher, i.e. one
+worker process.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# Weight of the newest batch in the moving average of batch duration
+_EWMA_ALPHA = 0.2
+
+
+class Overloaded(Exception):
+    """
+    An item the batcher refused or dropped
+    retry_after is the predicted time in seconds until the queue drains.
+    """
+
+    reason = 'overloaded'
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class QueueFull(Overloaded):
+    reason = 'queue_full'
+
+
+class DeadlineExceeded(Overloaded):
+    """The item's deadline passed, or would pass before it could run"""
+    reason = 'deadline'
+
+
+class Expired(DeadlineExceeded):
+    """The item's deadline passed while it waited in the queue"""
+    reason = 'expired'
+
+
+class Superseded(Exception):
+    """A newer item with the same key arrived while this one was still queued"""
+    reason = 'superseded'
+
+
+class _Entry:
+    __slots__ = ('item', 'future', 'deadline', 'key', 'queued')
+
+    def __init__(self, item, future, deadline, key):
+        self.item = item
+        self.future = future
+        self.deadline = deadline
+        self.key = key
+        # True until the batching thread takes it or a newer item supersedes it
+        self.queued = True
+
+
+class MicroBatcher:
+    """
+    Groups concurrent inference requests into batched model calls
+
+    Request threads call submit() and block until their result is ready.
+    A single background thread drains the queue: it waits for the first
+    item, keeps collecting until either max_batch_size items are queued or
+    max_wait_ms has passed, then calls run_batch(items) once and fans the
+    per-item outputs back to the waiting requests.
+
+    max_queue_size bounds the items waiting (0 = unbounded; never less than
+    one full batch). Deadlines are
+    time.monotonic() values; the predicted wait comes from a moving average
+    of recent batch durations.
+    """
+
+    def __init__(self, run_batch, max_batch_size=8, max_wait_ms=5.0, max_queue_size=0):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.max_queue_size = max(max_queue_size, max_batch_size) if max_queue_size > 0 else 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._pending = 0
+        self._busy = False
+        self._batch_seconds = None
+        self._latest = {}
+
+    def _ensure_started(self):
+        """
+        Start the batching thread on first use
+        Threads do not survive fork(), so a worker forked from a preloaded
+        master gets its own thread the first time it submits work
+        """
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid:
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == pid:
+                return
+            if self._pid != pid:
+                self._queue = queue.Queue()
+                self._pending = 0
+                self._busy = False
+                self._latest = {}
+            self._pid = pid
+            self._thread = threading.Thread(
+                target=self._loop, name="micro-batcher", daemon=True
+            )
+            self._thread.start()
+
+    @property
+    def pending(self):
+        """Items queued and not yet picked up by the batching thread"""
+        return self._pending
+
+    def estimated_wait(self):
+        """Predicted seconds until an item queued now has its output"""
+        if self._batch_seconds is None:
+            return 0.0
+        batches = self._pending // self.max_batch_size + 1 + (1 if self._busy else 0)
+        return batches * self._batch_seconds
+
+    def submit_async(self, item, deadline=None, key=None):
+        """
+        Queue a single item and return a Future for its output
+        Raises QueueFull or DeadlineExceeded instead of queueing work that
+        cannot be served in time. A still-queued item with the same key is
+        answered with Superseded.
+        """
+        self._ensure_started()
+        with self._lock:
+            previous = self._latest.get(key) if key is not None else None
+            if previous is not None and not previous.queued:
+                previous = None
+            # The item being replaced does not count against the new one
+            pending = self._pending - (1 if previous is not None else 0)
+            if self.max_queue_size and pending >= self.max_queue_size:
+                raise QueueFull(f"Inference queue is full ({pending} waiting)",
+                                self.estimated_wait())
+            wait = self.estimated_wait()
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise DeadlineExceeded(f"Predicted wait {wait * 1000:.0f}ms exceeds the request deadline", wait)
+            if previous is not None:
+                previous.queued = False
+            entry = _Entry(item, Future(), deadline, key)
+            self._pending = pending + 1
+            if key is not None:
+                self._latest[key] = entry
+        if previous is not None and not previous.future.done():
+            previous.future.set_exception(Superseded("A newer frame from the same session arrived"))
+        self._queue.put(entry)
+        return entry.future
+
+    def submit(self, item, timeout=None, deadline=None, key=None):
+        """Queue a single item and block until its output is ready"""
+        return self.submit_async(item, deadline, key).result(timeout=timeout)
+
+    def _take(self, entry):
+        """Claim a dequeued entry for this batch; False if it was superseded"""
+        with self._lock:
+            if not entry.queued:
+                return False
+            entry.queued = False
+            self._pending -= 1
+            if entry.key is not None and self._latest.get(entry.key) is entry:
+                del self._latest[entry.key]
+            return True
+
+    def _collect(self):
+        """Block for the first item, then gather more until the window closes"""
+        batch = []
+        while not batch:
+            entry = self._queue.get()
+            if self._take(entry):
+                batch.append(entry)
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    entry = self._queue.get(timeout=remaining)
+                else:
+                    # Window closed: still take anything already waiting
+                    entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if self._take(entry):
+                batch.append(entry)
+        return batch
+
+    def _loop(self):
+        while True:
+            collected = self._collect()
+            now = time.monotonic()
+            batch = []
+            for entry in collected:
+                # Drop requests whose callers have already given up
+                if not entry.future.set_running_or_notify_cancel():
+                    continue
+                # Frames that went stale in the queue are answered without running
+                if entry.deadline is not None and now > entry.deadline:
+                    entry.future.set_exception(Expired("Request deadline passed while queued", self.estimated_wait()))
+                    continue
+                batch.append((entry.item, entry.future))
+            if not batch:
+                continue
+
+            self._busy = True
+            start = time.perf_counter()
+            try:
+                outputs = self.run_batch([item for item, _ in batch])
+                if len(outputs) != len(batch):
+                    raise RuntimeError(
+                        f"run_batch returned {len(outputs)} outputs for {len(batch)} inputs"
+                    )
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            finally:
+                self._busy = False
+                elapsed = time.perf_counter() - start
+                if self._batch_seconds is None:
+                    self._batch_seconds = elapsed
+                else:
+                    self._batch_seconds += _EWMA_ALPHA * (elapsed - self._batch_seconds)
+
+            for (_, future), output in zip(batch, outputs):
+                future.set_result(output)
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Local CPU benchmarks for the inference server
+
+Runs the same model code as inference.py in-process (no HTTP) so serving
+knobs can be compared on a developer machine.
+
+Usage:
+  python benchmark.py batching --model yolo11n.pt
+  python benchmark.py batching --model yolo11n.pt --concurrency 8 --batch-sizes 1,4,8 --wait-ms 0,5,10
+  python benchmark.py imgsz --model yolo11n.pt --sizes 640,480,320
+  python benchmark.py encoding --model yolo11n.pt --images-dir full_res/ --formats jpeg,webp
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).parent.absolute()
+DEFAULT_IMAGES_DIR = SCRIPT_DIR.parent / "backend" / "tests" / "integration" / "resized"
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+
+# OpenCV encoder settings per --formats name
+ENCODERS = {
+    'jpeg': ('.jpg', 'IMWRITE_JPEG_QUALITY'),
+    'webp': ('.webp', 'IMWRITE_WEBP_QUALITY'),
+}
+
+# Formats the stream backend accepts (ObjectDetectionHandler checks JPEG/PNG
+# magic bytes); other formats are measured for information only
+BACKEND_FORMATS = {'jpeg'}
+
+# API Gateway's WebSocket frame limit and the longest frame id the load test
+# sends; the frame budget is computed as in test_sagemaker_inference.py's
+# max_raw_bytes (that client is not copied into the image)
+FRAME_LIMIT_BYTES = 32 * 1024
+MAX_FRAME_ID = 10 ** 9 - 1
+
+
+def frame_raw_budget(limit=FRAME_LIMIT_BYTES):
+    """Raw image bytes whose base64 `frame` message (longest frame id) fits in limit bytes"""
+    overhead = len(json.dumps({"action": "frame", "body": "", "frameId": MAX_FRAME_ID}).encode('utf-8'))
+    return (limit - overhead) // 4 * 3
+
+
+def parse_list(value, cast):
+    return [cast(v) for v in value.split(',') if v.strip()]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def load_inference(model_path):
+    """Import inference.py with the given weights instead of /opt/program"""
+    os.environ['MODEL_PATH'] = str(model_path)
+    sys.path.insert(0, str(SCRIPT_DIR))
+    import inference
+    if inference.model is None:
+        raise RuntimeError(f"Model failed to load from {model_path}")
+    # Benchmarks call the model directly, so let warm-up finish first
+    inference.ready.wait()
+    return inference
+
+
+def load_frames(images_dir, imgsz):
+    """Decode and letterbox every image once, as the server does per request"""
+    from decode import decode_image, letterbox
+    paths = sorted(p for p in Path(images_dir).iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+    if not paths:
+        raise RuntimeError(f"No images found in {images_dir}")
+    frames = []
+    for path in paths:
+        bgr, original_size = decode_image(path.read_bytes(), imgsz)
+        frames.append(letterbox(bgr, original_size, imgsz))
+    return frames
+
+
+def load_images(images_dir, imgsz):
+    """Letterboxed model inputs for every image"""
+    return [frame.image for frame in load_frames(images_dir, imgsz)]
+
+
+def run_closed_loop(submit, images, concurrency, total_requests):
+    """
+    Drive submit() from `concurrency` client threads until total_requests
+    have completed. Returns (wall_seconds, sorted latencies in ms).
+    """
+    latencies = []
+    lock = threading.Lock()
+    counter = iter(range(total_requests))
+
+    def client():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            start = time.perf_counter()
+            submit(images[i % len(images)])
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed_ms)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start, sorted(latencies)
+
+
+def benchmark_batching(args):
+    """Throughput and latency vs. micro-batching window"""
+    inference = load_inference(args.model)
+    from batching import MicroBatcher
+
+    images = load_images(args.images_dir, inference.MODEL_IMGSZ)
+
+    print(f"Images: {len(images)}  Concurrency: {args.concurrency}  Requests/config: {args.requests}")
+    print(f"{'batch':>5} {'wait_ms':>8} {'fps':>8} {'p50_ms':>8} {'p95_ms':>8} {'avg_batch':>9}")
+
+    for max_batch_size in parse_list(args.batch_sizes, int):
+        for wait_ms in parse_list(args.wait_ms, float):
+            batch_sizes = []
+
+            def run_batch(items):
+                batch_sizes.append(len(items))
+                return inference.run_batch(items)
+
+            batcher = MicroBatcher(run_batch, max_batch_size=max_batch_size, max_wait_ms=wait_ms)
+            wall, latencies = run_closed_loop(
+                lambda image: batcher.submit((image, inference.DEFAULT_OPTIONS)),
+                images, args.concurrency, args.requests
+            )
+
+            avg_batch = sum(batch_sizes) / len(batch_sizes) if batch_sizes else 0
+            print(f"{max_batch_size:>5} {wait_ms:>8.1f} {len(latencies) / wall:>8.2f} "
+                  f"{percentile(latencies, 50):>8.1f} {percentile(latencies, 95):>8.1f} {avg_batch:>9.2f}")
+    return 0
+
+
+def benchmark_imgsz(args):
+    """Latency and detections per input size, against the largest size as reference"""
+    inference = load_inference(args.model)
+    from decode import scale_to_original
+    from detections import match_detections
+
+    sizes = sorted(parse_list(args.sizes, int), reverse=True)
+    options = inference.DEFAULT_OPTIONS._replace(conf=args.conf)
+    print(f"Reference: imgsz {sizes[0]}  conf: {args.conf}  Repeats/image: {args.repeats}")
+    print(f"{'imgsz':>5} {'p50_ms':>8} {'p95_ms':>8} {'fps':>8} {'dets/img':>9} {'d_dets':>7} {'recall':>7}")
+
+    reference = None
+    for imgsz in sizes:
+        frames = load_frames(args.images_dir, imgsz)
+        # One untimed pass so any per-shape setup is not billed to this size
+        inference.run_batch([(frames[0].image, options)])
+
+        latencies, detections = [], []
+        for frame in frames:
+            for _ in range(args.repeats):
+                start = time.perf_counter()
+                (result, _), = inference.run_batch([(frame.image, options)])
+                latencies.append((time.perf_counter() - start) * 1000)
+            detections.append(scale_to_original(result, frame))
+        latencies.sort()
+
+        if reference is None:
+            reference = detections
+        total_ref = sum(len(d) for d in reference)
+        matched = sum(len(match_detections(ref, det)) for ref, det in zip(reference, detections))
+        recall = matched / total_ref if total_ref else 1.0
+        per_image = sum(len(d) for d in detections) / len(detections)
+        delta = per_image - total_ref / len(reference)
+        fps = 1000.0 / (sum(latencies) / len(latencies))
+        print(f"{imgsz:>5} {percentile(latencies, 50):>8.1f} {percentile(latencies, 95):>8.1f} {fps:>8.2f} "
+              f"{per_image:>9.2f} {delta:>+7.2f} {recall:>7.3f}")
+    return 0
+
+
+def pareto_frontier(rows, cost, value):
+    """Rows no other row beats on both cost (lower) and value (higher)"""
+    frontier, best_value = [], None
+    for row in sorted(rows, key=lambda r: (r[cost], -r[value])):
+        if best_value is None or row[value] > best_value:
+            frontier.append(row)
+            best_value = row[value]
+    return frontier
+
+
+def benchmark_encoding(args):
+    """
+    Detection fidelity vs. payload size across client encodings
+
+    Every image is re-encoded at each long edge, quality and format, as the
+    mobile client would before sending, and run through the model. Recall
+    counts reference detections (from the original image) that the variant
+    still finds with the same class at IoU >= --iou. Only formats in
+    BACKEND_FORMATS are recommended; WebP is shown for comparison.
+    """
+    import cv2
+    import numpy as np
+    if args.max_bytes is None:
+        args.max_bytes = frame_raw_budget()
+    formats = parse_list(args.formats, str)
+    for name in formats:
+        if name not in ENCODERS:
+            raise SystemExit(f"Unknown format {name!r}; choose from {', '.join(ENCODERS)}")
+    inference = load_inference(args.model)
+    from decode import decode_image, letterbox, scale_to_original
+    from detections import Detections, match_detections
+
+    imgsz = inference.MODEL_IMGSZ
+    options = inference.DEFAULT_OPTIONS._replace(conf=args.conf)
+    settings = [(name, edge, quality) for name in formats
+                for edge in sorted(parse_list(args.edges, int), reverse=True)
+                for quality in sorted(parse_list(args.qualities, int), reverse=True)]
+    paths = sorted(p for p in Path(args.images_dir).iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+    if not paths:
+        raise RuntimeError(f"No images found in {args.images_dir}")
+
+    def detect(frames):
+        results = []
+        for start in range(0, len(frames), inference.BATCH_MAX_SIZE):
+            chunk = frames[start:start + inference.BATCH_MAX_SIZE]
+            outputs = inference.run_batch([(frame.image, options) for frame in chunk])
+            results.extend(scale_to_original(result, frame) for (result, _), frame in zip(outputs, chunk))
+        return results
+
+    totals = {setting: {'bytes': [], 'encode_ms': 0.0, 'kept': 0, 'found': 0} for setting in settings}
+    reference_count = image_count = 0
+    for path in paths:
+        data = path.read_bytes()
+        original = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+        if original is None:
+            print(f"Skipping unreadable {path.name}")
+            continue
+        image_count += 1
+        height, width = original.shape[:2]
+        reference, = detect([letterbox(*decode_image(data, imgsz), imgsz)])
+        reference_count += len(reference)
+
+        variants, sizes = [], []
+        for name, edge, quality in settings:
+            extension, flag = ENCODERS[name]
+            start = time.perf_counter()
+            ratio = min(1.0, edge / max(width, height))
+            image = original
+            if ratio < 1.0:
+                size = (max(1, round(width * ratio)), max(1, round(height * ratio)))
+                image = cv2.resize(original, size, interpolation=cv2.INTER_AREA)
+            ok, encoded = cv2.imencode(extension, image, [getattr(cv2, flag), quality])
+            encode_ms = (time.perf_counter() - start) * 1000
+            if not ok:
+                raise RuntimeError(f"OpenCV cannot encode {name}")
+            totals[(name, edge, quality)]['bytes'].append(encoded.size)
+            totals[(name, edge, quality)]['encode_ms'] += encode_ms
+            variants.append(letterbox(*decode_image(encoded.tobytes(), imgsz), imgsz))
+            sizes.append(image.shape[1::-1])
+
+        for setting, (variant_w, variant_h), result in zip(settings, sizes, detect(variants)):
+            # Back to the original's pixel coordinates before matching
+            scale = np.array([width / variant_w, height / variant_h] * 2, dtype=np.float32)
+            result = Detections(xyxy=result.xyxy * scale, class_ids=result.class_ids,
+                                confidence=result.confidence)
+            matches = match_detections(reference, result, args.iou)
+            totals[setting]['kept'] += sum(1 for i, j, _ in matches
+                                           if reference.class_ids[i] == result.class_ids[j])
+            totals[setting]['found'] += len(result)
+
+    rows = []
+    for (name, edge, quality), total in totals.items():
+        sizes = sorted(total['bytes'])
+        if not sizes:
+            continue
+        rows.append({
+            'format': name,
+            'edge': edge,
+            'quality': quality,
+            'mean_bytes': round(sum(sizes) / len(sizes)),
+            'max_bytes': sizes[-1],
+            'fits': sum(1 for size in sizes if size <= args.max_bytes) / len(sizes),
+            'encode_ms': round(total['encode_ms'] / len(sizes), 2),
+            'recall': round(total['kept'] / reference_count, 4) if reference_count else 1.0,
+            'precision': round(total['kept'] / total['found'], 4) if total['found'] else 1.0,
+        })
+    if not rows:
+        raise RuntimeError(f"No readable images in {args.images_dir}")
+
+    frontier = pareto_frontier(rows, 'mean_bytes', 'recall')
+    print(f"Images: {image_count}  Reference detections: {reference_count}  conf: {args.conf}  "
+          f"IoU: {args.iou}  Frame budget: {args.max_bytes} bytes")
+    print(f"{'format':<6} {'edge':>5} {'q':>3} {'mean_kb':>8} {'max_kb':>7} {'fits':>5} {'enc_ms':>7} "
+          f"{'recall':>7} {'prec':>6}")
+    for row in sorted(rows, key=lambda r: r['mean_bytes']):
+        mark = ' *' if row in frontier else ''
+        if row['format'] not in BACKEND_FORMATS:
+            mark += ' (not accepted by the backend)'
+        print(f"{row['format']:<6} {row['edge']:>5} {row['quality']:>3} {row['mean_bytes'] / 1024:>8.1f} "
+              f"{row['max_bytes'] / 1024:>7.1f} {row['fits']:>5.0%} {row['encode_ms']:>7.2f} "
+              f"{row['recall']:>7.3f} {row['precision']:>6.3f}{mark}")
+    print("* Pareto-optimal: no other setting has higher recall for fewer bytes")
+
+    # The client needs every frame to fit in a format the backend decodes,
+    # so pick among settings that always do
+    usable = [row for row in rows if row['fits'] == 1.0 and row['format'] in BACKEND_FORMATS]
+    fitting = pareto_frontier(usable, 'mean_bytes', 'recall')
+    recommended = fitting[-1] if fitting else None
+    if recommended:
+        print(f"Recommended within the frame budget: {recommended['format']} at {recommended['edge']}px, "
+              f"quality {recommended['quality']} (recall {recommended['recall']:.3f}, "
+              f"{recommended['mean_bytes'] / 1024:.1f} KB mean)")
+    else:
+        print(f"No {'/'.join(sorted(BACKEND_FORMATS))} setting fits every image within the frame budget; "
+              f"add smaller --edges or --qualities")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'settings': rows, 'frontier': frontier, 'recommended': recommended}, f, indent=2)
+        print(f"Results: {args.output}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local benchmarks for the YOLOv11 inference server')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    batching = subparsers.add_parser('batching', help='Throughput vs. micro-batching window')
+    batching.add_argument('--model', default='yolo11n.pt', help='Path to model weights')
+    batching.add_argument('--images-dir', default=str(DEFAULT_IMAGES_DIR),
+                          help='Directory of test images (default: bundled integration images)')
+    batching.add_argument('--concurrency', type=int, default=8, help='Concurrent client threads')
+    batching.add_argument('--requests', type=int, default=64, help='Requests per configuration')
+    batching.add_argument('--batch-sizes', default='1,2,4,8', help='Comma-separated max batch sizes')
+    batching.add_argument('--wait-ms', default='0,2,5,10', help='Comma-separated max wait windows (ms)')
+    batching.set_defaults(func=benchmark_batching)
+
+    imgsz = subparsers.add_parser('imgsz', help='Latency and detection deltas per input size')
+    imgsz.add_argument('--model', default='yolo11n.pt', help='Path to model weights')
+    imgsz.add_argument('--images-dir', default=str(DEFAULT_IMAGES_DIR),
+                       help='Directory of test images (default: bundled integration images)')
+    imgsz.add_argument('--sizes', default='640,480,320', help='Comma-separated input sizes (largest is the reference)')
+    imgsz.add_argument('--repeats', type=int, default=3, help='Timed forward passes per image and size')
+    imgsz.add_argument('--conf', type=float, default=0.25, help='Confidence threshold for counted detections')
+    imgsz.set_defaults(func=benchmark_imgsz)
+
+    encoding = subparsers.add_parser('encoding', help='Detection recall vs. payload size per client encoding')
+    encoding.add_argument('--model', default='yolo11n.pt', help='Path to model weights')
+    encoding.add_argument('--images-dir', default=str(DEFAULT_IMAGES_DIR),
+                          help='Directory of full-resolution test images (default: bundled integration images)')
+    encoding.add_argument('--formats', default='jpeg,webp',
+                          help=f"Comma-separated formats ({', '.join(ENCODERS)}); only "
+                               f"{', '.join(sorted(BACKEND_FORMATS))} can be recommended, the rest are for comparison")
+    encoding.add_argument('--edges', default='1280,960,800,640,480,320', help='Comma-separated long edges (px)')
+    encoding.add_argument('--qualities', default='90,80,70,60,50,40', help='Comma-separated encoder qualities')
+    encoding.add_argument('--conf', type=float, default=0.25, help='Confidence threshold for counted detections')
+    encoding.add_argument('--iou', type=float, default=0.5, help='IoU for a detection to count as kept')
+    encoding.add_argument('--max-bytes', type=int, default=None,
+                          help='Encoded size that fits one WebSocket frame '
+                               '(default: the raw budget of a 32 KB frame message)')
+    encoding.add_argument('--output', default=None, help='Write all settings and the frontier as JSON')
+    encoding.set_defaults(func=benchmark_encoding)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    exit(main())
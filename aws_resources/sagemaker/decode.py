@@ -0,0 +1,178 @@
+"""
+Fast image decode and letterboxing for the inference server
+JPEGs are decoded with libjpeg-turbo scale-on-decode (via OpenCV) straight to
+roughly the model input size, then letterboxed into a preallocated buffer.
+Already-decoded RGB frames (raw or .npy) are wrapped without copying.
+"""
+
+import io
+from typing import NamedTuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from detections import Detections
+
+# Ultralytics pads letterboxed frames with gray 114
+PAD_VALUE = 114
+
+# Letterboxed sides are padded up to a multiple of the model stride
+STRIDE = 32
+
+# Largest raw frame accepted on either side
+MAX_RAW_SIDE = 8192
+
+# DCT scaling factors libjpeg-turbo can apply while decoding
+_REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+class LetterboxedFrame(NamedTuple):
+    """
+    A frame ready for the model plus what is needed to map boxes back
+
+    image: (H, W, 3) uint8 BGR array, long side imgsz, both sides multiples of STRIDE
+    width/height: original image size reported in the response
+    scale_x/scale_y: letterboxed pixels per original pixel
+    pad_x/pad_y: left/top padding inside the letterboxed image
+    """
+    image: np.ndarray
+    width: int
+    height: int
+    scale_x: float
+    scale_y: float
+    pad_x: int
+    pad_y: int
+
+
+def decode_image(image_bytes, imgsz):
+    """
+    Decode JPEG/PNG bytes to a BGR array no smaller than imgsz on its long side
+    Returns (bgr_array, (original_width, original_height)).
+    Raises ValueError if the bytes are not a readable image.
+    """
+    try:
+        # Only parses the header; pixel data is not decoded here
+        header = Image.open(io.BytesIO(image_bytes))
+        width, height = header.size
+    except Exception as e:
+        raise ValueError(str(e)) from e
+
+    factor = 1
+    if header.format == 'JPEG':
+        for candidate in (8, 4, 2):
+            if max(width, height) // candidate >= imgsz:
+                factor = candidate
+                break
+
+    # PIL does not apply EXIF rotation either, so keep sizes consistent
+    flags = _REDUCED_FLAGS[factor] | cv2.IMREAD_IGNORE_ORIENTATION
+    bgr = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), flags)
+
+    if bgr is None:
+        # Formats OpenCV cannot read (e.g. GIF) go through PIL at full size
+        try:
+            rgb = np.asarray(header.convert('RGB'))
+        except Exception as e:
+            raise ValueError(str(e)) from e
+        bgr = np.ascontiguousarray(rgb[:, :, ::-1])
+
+    return bgr, (width, height)
+
+
+def wrap_raw_rgb(data, width, height, stride=None):
+    """
+    View packed 8-bit RGB pixels as an (H, W, 3) array without copying
+    stride is the number of bytes per row (defaults to width * 3); rows may
+    carry padding after the last pixel.
+    """
+    if not (0 < width <= MAX_RAW_SIDE and 0 < height <= MAX_RAW_SIDE):
+        raise ValueError(f"width and height must be between 1 and {MAX_RAW_SIDE}")
+    stride = width * 3 if stride is None else stride
+    if stride < width * 3:
+        raise ValueError(f"stride {stride} is smaller than width * 3 ({width * 3})")
+    needed = stride * (height - 1) + width * 3
+    if len(data) < needed:
+        raise ValueError(f"expected at least {needed} bytes for {width}x{height} RGB, got {len(data)}")
+    flat = np.frombuffer(data, dtype=np.uint8)
+    return np.lib.stride_tricks.as_strided(
+        flat, shape=(height, width, 3), strides=(stride, 3, 1), writeable=False
+    )
+
+
+def wrap_npy(data):
+    """View a serialized .npy (H, W, 3) uint8 RGB array without copying its pixels"""
+    stream = io.BytesIO(data)
+    try:
+        version = np.lib.format.read_magic(stream)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(stream)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(stream)
+    except Exception as e:
+        raise ValueError(f"not a .npy array: {e}") from e
+    if dtype != np.uint8 or len(shape) != 3 or shape[2] != 3 or fortran_order:
+        raise ValueError(f"expected a C-order (H, W, 3) uint8 RGB array, got {dtype} {shape}")
+    height, width = shape[:2]
+    if not (0 < width <= MAX_RAW_SIDE and 0 < height <= MAX_RAW_SIDE):
+        raise ValueError(f"width and height must be between 1 and {MAX_RAW_SIDE}")
+    count = height * width * 3
+    offset = stream.tell()
+    if len(data) - offset < count:
+        raise ValueError(f"truncated .npy: expected {count} bytes of pixels")
+    return np.frombuffer(data, dtype=np.uint8, count=count, offset=offset).reshape(shape)
+
+
+def letterbox(image, original_size, imgsz, out=None, rgb=False):
+    """
+    Resize image so its long side is imgsz, centered on gray padding that only
+    rounds each side up to the model stride (rectangular inference, as
+    Ultralytics does for a single image). Writes into `out` when its shape
+    matches so steady-state requests do not allocate. RGB input (rgb=True)
+    is swapped to BGR while it is copied into the buffer.
+    """
+    h, w = image.shape[:2]
+    ratio = min(imgsz / w, imgsz / h)
+    new_w = max(1, min(imgsz, int(round(w * ratio))))
+    new_h = max(1, min(imgsz, int(round(h * ratio))))
+    if (new_w, new_h) != (w, h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+
+    out_w = -(-new_w // STRIDE) * STRIDE
+    out_h = -(-new_h // STRIDE) * STRIDE
+    if out is None or out.shape != (out_h, out_w, 3):
+        out = np.empty((out_h, out_w, 3), dtype=np.uint8)
+
+    pad_x = (out_w - new_w) // 2
+    pad_y = (out_h - new_h) // 2
+    out.fill(PAD_VALUE)
+    out[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = image[:, :, ::-1] if rgb else image
+
+    width, height = original_size
+    return LetterboxedFrame(
+        image=out,
+        width=width,
+        height=height,
+        scale_x=new_w / width,
+        scale_y=new_h / height,
+        pad_x=pad_x,
+        pad_y=pad_y,
+    )
+
+
+def scale_to_original(detections, frame):
+    """Map boxes from letterboxed model coordinates back to original image pixels"""
+    if len(detections) == 0:
+        return detections
+    offset = np.array([frame.pad_x, frame.pad_y, frame.pad_x, frame.pad_y], dtype=np.float32)
+    scale = np.array([frame.scale_x, frame.scale_y, frame.scale_x, frame.scale_y], dtype=np.float32)
+    xyxy = (detections.xyxy - offset) / scale
+    np.clip(xyxy[:, 0::2], 0, frame.width, out=xyxy[:, 0::2])
+    np.clip(xyxy[:, 1::2], 0, frame.height, out=xyxy[:, 1::2])
+    return Detections(xyxy=xyxy, class_ids=detections.class_ids, confidence=detections.confidence,
+                      track_ids=detections.track_ids)
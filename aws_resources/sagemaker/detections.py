@@ -0,0 +1,109 @@
+"""
+Vectorized post-processing of YOLO results
+Converts Ultralytics Results into NumPy arrays with a single host transfer and
+builds the /invocations predictions list from those arrays
+"""
+
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+
+class Detections(NamedTuple):
+    """
+    Detections for one image as parallel arrays
+
+    xyxy: (N, 4) float32 box corners in original image pixels
+    class_ids: (N,) int64 COCO class indices
+    confidence: (N,) float32 scores between 0.0 and 1.0
+    track_ids: (N,) int64 per-session object ids in tracking mode, else None
+    """
+    xyxy: np.ndarray
+    class_ids: np.ndarray
+    confidence: np.ndarray
+    track_ids: Optional[np.ndarray] = None
+
+    def __len__(self):
+        return len(self.confidence)
+
+
+def build_class_names(names):
+    """Turn model.names ({id: name}) into an array indexable by class id"""
+    lookup = np.empty(max(names) + 1 if names else 0, dtype=object)
+    for class_id, name in names.items():
+        lookup[class_id] = name
+    return lookup
+
+
+def from_result(result):
+    """
+    Convert one Ultralytics Results object to Detections
+    boxes.data is (N, 6) = [x1, y1, x2, y2, conf, cls]; moving it to the host
+    once replaces the per-box .tolist()/.item() calls and their syncs
+    """
+    data = result.boxes.data
+    if hasattr(data, 'cpu'):
+        data = data.cpu().numpy()
+    data = np.asarray(data, dtype=np.float32).reshape(-1, 6)
+    return Detections(
+        xyxy=data[:, :4],
+        class_ids=data[:, 5].astype(np.int64),
+        confidence=data[:, 4],
+    )
+
+
+def to_predictions(detections, class_names):
+    """Build the predictions list (Ultralytics format) in one pass over the arrays"""
+    if len(detections) == 0:
+        return []
+    # Truncate toward zero like int(x) did per coordinate
+    coords = detections.xyxy.astype(np.int64).tolist()
+    names = class_names[detections.class_ids].tolist()
+    scores = detections.confidence.tolist()
+    predictions = [
+        {
+            "class": name,
+            "confidence": score,
+            "box": {"x1": x1, "y1": y1, "x2": x2, "y2": y2}
+        }
+        for name, score, (x1, y1, x2, y2) in zip(names, scores, coords)
+    ]
+    if detections.track_ids is not None:
+        for prediction, track_id in zip(predictions, detections.track_ids.tolist()):
+            prediction["track_id"] = track_id
+    return predictions
+
+
+def box_iou(a, b):
+    """Pairwise IoU between (N, 4) and (M, 4) xyxy arrays, returned as (N, M)"""
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+    area_a = (a[:, 2] - a[:, 0]).clip(0) * (a[:, 3] - a[:, 1]).clip(0)
+    area_b = (b[:, 2] - b[:, 0]).clip(0) * (b[:, 3] - b[:, 1]).clip(0)
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    wh = (bottom_right - top_left).clip(0)
+    inter = wh[..., 0] * wh[..., 1]
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+def match_detections(reference, candidate, iou_threshold=0.5):
+    """
+    Greedily pair candidate boxes with reference boxes by descending IoU
+    Class-agnostic, so class agreement can be measured on the pairs.
+    Returns a list of (reference_index, candidate_index, iou).
+    """
+    if len(reference) == 0 or len(candidate) == 0:
+        return []
+    iou = box_iou(reference.xyxy, candidate.xyxy)
+    pairs = np.argwhere(iou >= iou_threshold)
+    order = np.argsort(-iou[pairs[:, 0], pairs[:, 1]], kind='stable')
+    used_ref, used_cand, matches = set(), set(), []
+    for i, j in pairs[order]:
+        if i in used_ref or j in used_cand:
+            continue
+        used_ref.add(i)
+        used_cand.add(j)
+        matches.append((int(i), int(j), float(iou[i, j])))
+    return matches
@@ -0,0 +1,103 @@
+"""
+Response encodings for /invocations, chosen from the Accept header
+
+application/json (default): Ultralytics-style list of prediction dicts
+application/x-msgpack: the same response with predictions packed straight
+from the NumPy arrays instead of one dict per box:
+
+  {
+    "success": true,
+    "format": "packed-v1",
+    "count": N,
+    "classes": ["person", "chair"],     # names present in this response
+    "class_index": <N x uint8>,        # index into "classes"
+    "confidence": <N x float32 LE>,
+    "boxes": <N x 4 int32 LE>,         # x1, y1, x2, y2 in original pixels
+    "track_ids": <N x int32 LE>,       # tracking mode only
+    "image": {"width": W, "height": H}
+  }
+
+Decode with e.g. numpy.frombuffer(resp["boxes"], "<i4").reshape(-1, 4).
+"""
+
+import json
+
+import msgpack
+import numpy as np
+
+from detections import to_predictions
+
+JSON = 'application/json'
+MSGPACK = 'application/x-msgpack'
+
+# Alternative spellings clients send for the same encodings
+_MEDIA_TYPES = {
+    'application/json': JSON,
+    'application/x-msgpack': MSGPACK,
+    'application/msgpack': MSGPACK,
+    'application/vnd.msgpack': MSGPACK,
+}
+
+
+def negotiate(accept):
+    """Pick the response media type from an Accept header (JSON if nothing better matches)"""
+    if not accept:
+        return JSON
+    candidates = []
+    for position, part in enumerate(accept.split(',')):
+        media_type, *params = [p.strip() for p in part.split(';')]
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0 and media_type.lower() in _MEDIA_TYPES:
+            candidates.append((-quality, position, _MEDIA_TYPES[media_type.lower()]))
+    return min(candidates)[2] if candidates else JSON
+
+
+def encode_json(body):
+    return json.dumps(body, separators=(',', ':')).encode('utf-8')
+
+
+def _with_predictions(body, predictions):
+    # Keep the original key order: success, predictions, image
+    encoded = {"success": body["success"], "predictions": predictions}
+    encoded.update((k, v) for k, v in body.items() if k != "success")
+    return encoded
+
+
+def _packed(detections, class_names):
+    names, class_index = np.unique(class_names[detections.class_ids], return_inverse=True)
+    packed = {
+        "format": "packed-v1",
+        "count": len(detections),
+        "classes": names.tolist(),
+        "class_index": class_index.astype(np.uint8).tobytes(),
+        "confidence": detections.confidence.astype('<f4').tobytes(),
+        "boxes": detections.xyxy.astype('<i4').tobytes(),
+    }
+    if detections.track_ids is not None:
+        packed["track_ids"] = detections.track_ids.astype('<i4').tobytes()
+    return packed
+
+
+def encode(body, detections, class_names, media_type=JSON):
+    """
+    Serialize a response body; detections (or None for errors) become the
+    predictions in the requested encoding
+    """
+    if media_type == MSGPACK:
+        if detections is not None:
+            packed = {"success": body["success"]}
+            packed.update(_packed(detections, class_names))
+            packed.update((k, v) for k, v in body.items() if k != "success")
+            body = packed
+        return msgpack.packb(body, use_bin_type=True)
+
+    if detections is not None:
+        body = _with_predictions(body, to_predictions(detections, class_names))
+    return encode_json(body)
@@ -0,0 +1,101 @@
+"""
+Gunicorn settings for the inference server (loaded by serve)
+
+MODEL_SERVER_WORKERS sets the number of worker processes ("auto" = one per
+TORCH_THREADS_PER_WORKER cores). With more than one worker the app is
+preloaded in the master, which on CPU also builds the fused inference model
+(see inference.build_predictor_before_fork), so the weights are loaded once
+and shared copy-on-write by every forked worker; with CUDA each worker
+still builds its own. Each worker then pins its own thread budget (torch,
+or the ONNX Runtime / OpenVINO session) so workers x threads matches the
+core count.
+
+Preloading is limited to the torch backend: ONNX Runtime and OpenVINO
+sessions own native thread pools that do not survive fork(), so those
+backends load the model in each worker instead.
+
+Settings from a serving profile (see settings.py) are applied first, so a
+profile written by `python -m inference autotune` sets these knobs too.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from settings import apply_profile
+
+apply_profile()
+
+_cpu_count = os.cpu_count() or 1
+
+
+def _workers():
+    value = os.environ.get('MODEL_SERVER_WORKERS', '1').strip().lower()
+    if value == 'auto':
+        per_worker = int(os.environ.get('TORCH_THREADS_PER_WORKER', '1'))
+        return max(1, _cpu_count // max(1, per_worker))
+    return max(1, int(value))
+
+
+workers = _workers()
+# The app reads the resolved count ("auto" included) to turn off per-process
+# session features that need every frame of a session in one worker
+os.environ['MODEL_SERVER_WORKERS'] = str(workers)
+
+# Request threads per worker (sync Flask app; ignored by the Uvicorn worker)
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+
+# Load the model before forking so workers share its pages
+preload_app = workers > 1 and os.environ.get('INFERENCE_BACKEND', 'torch').lower() == 'torch'
+
+# A preloaded model is warmed up in each worker after fork, not in the master
+if preload_app:
+    os.environ['WARMUP_AFTER_FORK'] = '1'
+
+# Intra-op threads per worker; defaults to an even split of the cores
+torch_threads = int(os.environ.get('TORCH_THREADS_PER_WORKER', str(max(1, _cpu_count // workers))))
+
+
+def memory_report():
+    """RSS/PSS/shared/private MB for this process, from /proc/self/smaps_rollup"""
+    fields = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                    fields[parts[0][:-1]] = int(parts[1])
+    except OSError:
+        return "memory stats unavailable"
+
+    def mb(*keys):
+        return sum(fields.get(k, 0) for k in keys) / 1024
+
+    return (f"RSS {mb('Rss'):.0f} MB (PSS {mb('Pss'):.0f} MB, "
+            f"shared {mb('Shared_Clean', 'Shared_Dirty'):.0f} MB, "
+            f"private {mb('Private_Clean', 'Private_Dirty'):.0f} MB)")
+
+
+def when_ready(server):
+    server.log.info(f"Master {os.getpid()}: {workers} worker(s) x {torch_threads} torch thread(s), "
+                    f"preload={'on' if preload_app else 'off'}, {memory_report()}")
+
+
+def post_fork(server, worker):
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+    except ImportError:
+        pass
+    # Read by inference.py when it loads the model in this worker, to size
+    # the ONNX Runtime / OpenVINO sessions (those backends are not preloaded)
+    os.environ.setdefault('INFERENCE_THREADS', str(torch_threads))
+
+    if preload_app:
+        inference = sys.modules.get('inference')
+        if inference is not None:
+            inference.start_warm_up()
+
+
+def post_worker_init(worker):
+    worker.log.info(f"Worker {os.getpid()}: {memory_report()}")
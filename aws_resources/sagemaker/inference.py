@@ -4,28 +4,239 @@ Receives JPEG images and returns object detection results in Ultralytics format
 """
 
 import os
+import sys
 import json
-import io
+import math
+import time
+import argparse
+import threading
 import traceback
-from flask import Flask, request, jsonify
-from PIL import Image
+from flask import Flask, Response, request, jsonify
 import numpy as np
 from ultralytics import YOLO
+from concurrent.futures import Future
+from batching import MicroBatcher, Overloaded, QueueFull, Expired, Superseded
+from pipeline import BufferPool, Stage
+from detections import build_class_names, from_result
+from decode import PAD_VALUE, STRIDE, decode_image, letterbox, scale_to_original, wrap_npy, wrap_raw_rgb
+from encoding import encode, negotiate
+from options import DEFAULT_OPTIONS, collect_params, parse_options
+from metrics import REGISTRY, STAGE_SECONDS, REQUESTS, BATCH_SIZE, SESSION_FRAMES, DROPPED, Gauge, StageTimer
+from settings import apply_profile
+from resolution import ResolutionLadder, parse_ladder
+from sessions import SessionState, SessionStore, frame_difference, thumbnail
+from tracking import Tracker
 
 # Initialize Flask app
 app = Flask(__name__)
 
+# Tuned settings from `python -m inference autotune`, unless set explicitly
+apply_profile()
+
+# Model is pre-downloaded to /opt/program/yolo11n.pt during Docker build
+MODEL_PATH = os.environ.get('MODEL_PATH', '/opt/program/yolo11n.pt')
+
+# Worker processes serving the endpoint (gunicorn.conf.py resolves "auto")
+_workers_value = os.environ.get('MODEL_SERVER_WORKERS', '1').strip()
+SERVER_WORKERS = int(_workers_value) if _workers_value.isdigit() else 1
+
+# Inference engine: torch (eager PyTorch), onnxruntime or openvino.
+# The exported models are produced from MODEL_PATH at image build time.
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'torch').lower()
+
+# Intra-op threads for ONNX Runtime and OpenVINO sessions (0 = the runtime's
+# default of one per core). gunicorn.conf.py sets it to each worker's share.
+INFERENCE_THREADS = int(os.environ.get('INFERENCE_THREADS', '0'))
+
+# Weight precision: fp32, or int8 (onnxruntime only, built by quantize.py)
+INFERENCE_PRECISION = os.environ.get('INFERENCE_PRECISION', 'fp32').lower()
+
+# Square model input size; frames are decoded and letterboxed to this
+MODEL_IMGSZ = int(os.environ.get('MODEL_IMGSZ', '640'))
+
+# Input sizes to fall back to under load, e.g. 640,480,320 (largest first).
+# The size is chosen per request from the predicted queue wait against
+# IMGSZ_TARGET_WAIT_MS and reported as "imgsz" in the response. The default
+# (MODEL_IMGSZ only) keeps the input size fixed.
+IMGSZ_LADDER = parse_ladder(os.environ.get('IMGSZ_LADDER', str(MODEL_IMGSZ)))
+IMGSZ_TARGET_WAIT_MS = float(os.environ.get('IMGSZ_TARGET_WAIT_MS', '150'))
+
+# Micro-batching window: concurrent requests arriving within BATCH_MAX_WAIT_MS
+# of each other share one forward pass (up to BATCH_MAX_SIZE images)
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', '8'))
+BATCH_MAX_WAIT_MS = float(os.environ.get('BATCH_MAX_WAIT_MS', '5'))
+
+# Admission control: at most QUEUE_MAX_SIZE frames wait for the model (0 =
+# unbounded); more are refused with 429. Requests carry a latency budget in
+# ms (X-Request-Deadline-Ms header or deadline_ms option, else
+# REQUEST_DEADLINE_MS; 0 = none) and get a fast 503 when the predicted wait
+# overshoots it or it runs out while queued. Both include Retry-After.
+QUEUE_MAX_SIZE = int(os.environ.get('QUEUE_MAX_SIZE', str(BATCH_MAX_SIZE * 4)))
+REQUEST_DEADLINE_MS = float(os.environ.get('REQUEST_DEADLINE_MS', '0'))
+
+# Latest frame wins: a session's frame still waiting for the model is answered
+# 200 {"status": "superseded"} as soon as a newer frame from it arrives. It is
+# an expected outcome, not an error: through InvokeEndpoint any non-2xx status
+# surfaces as a ModelError. Frames only supersede each other within one
+# worker process, so with MODEL_SERVER_WORKERS > 1 it rarely applies.
+SESSION_LATEST_WINS = os.environ.get('SESSION_LATEST_WINS', '1') == '1'
+
+# Staged pipeline (see pipeline.py): PIPELINE_DECODE_WORKERS threads decode
+# and letterbox while the batching thread runs the model and
+# PIPELINE_SERIALIZE_WORKERS threads encode responses. At most
+# PIPELINE_DECODE_QUEUE requests wait for a decode thread (0 = unbounded);
+# more are refused with 429, like a full inference queue.
+PIPELINE_DECODE_WORKERS = int(os.environ.get('PIPELINE_DECODE_WORKERS', str(min(4, os.cpu_count() or 1))))
+PIPELINE_DECODE_QUEUE = int(os.environ.get('PIPELINE_DECODE_QUEUE', str(BATCH_MAX_SIZE * 4)))
+PIPELINE_SERIALIZE_WORKERS = int(os.environ.get('PIPELINE_SERIALIZE_WORKERS', '2'))
+
+# Warm-up: synthetic frames pushed through the serving path at startup, at each
+# input size, batch size and aspect ratio, so the first real request does not
+# pay for lazy initialization. Rect letterboxing gives every aspect ratio its
+# own input shape (e.g. 384x640 for a 9:16 portrait frame), and backends
+# initialize per shape. /ping returns 503 until it finishes.
+# WARMUP_ITERATIONS=0 skips it. Batch sizes are capped at BATCH_MAX_SIZE.
+WARMUP_ITERATIONS = int(os.environ.get('WARMUP_ITERATIONS', '2'))
+WARMUP_SIZES = [int(v) for v in os.environ.get('WARMUP_SIZES', ','.join(map(str, IMGSZ_LADDER))).split(',') if v.strip()]
+WARMUP_BATCH_SIZES = [int(v) for v in os.environ.get('WARMUP_BATCH_SIZES', f"1,{BATCH_MAX_SIZE}").split(',') if v.strip()]
+# Width:height ratios of the frames the app sends (portrait and landscape)
+WARMUP_ASPECTS = [tuple(int(x) for x in v.split(':')) for v in
+                  os.environ.get('WARMUP_ASPECTS', '1:1,9:16,16:9,3:4,4:3').split(',') if v.strip()]
+
+# Frame skipping for clients that send a session id (X-Session-Id header or
+# session=... custom attribute): when a frame's grayscale thumbnail differs from
+# the session's last inferred frame by less than SESSION_DIFF_THRESHOLD (mean
+# absolute difference, 0-1), that frame's detections are returned with
+# "reused": true. After SESSION_MAX_REUSE reuses in a row the model runs anyway.
+# SESSION_DIFF_THRESHOLD=0 disables reuse. Session state lives in one worker
+# process and gunicorn spreads a session's requests over all workers, so with
+# MODEL_SERVER_WORKERS > 1 reuse would mostly miss; it is turned off then,
+# with a warning at startup.
+SESSION_DIFF_THRESHOLD = float(os.environ.get('SESSION_DIFF_THRESHOLD', '0.02'))
+SESSION_MAX_REUSE = int(os.environ.get('SESSION_MAX_REUSE', '5'))
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', '1024'))
+SESSION_TTL_SECONDS = float(os.environ.get('SESSION_TTL_SECONDS', '30'))
+
+# Tracking mode for session requests (TRACKING_MODE=1, or track=1 per request):
+# the detector runs on keyframes only and boxes are propagated in between by a
+# Kalman tracker, adding a stable track_id to each prediction. The keyframe
+# interval adapts between 1 and TRACK_MAX_INTERVAL frames; a thumbnail change
+# above TRACK_MOTION_THRESHOLD forces a keyframe. Keyframes run NMS with conf
+# down to TRACK_LOW_CONF so weak detections can keep existing tracks alive.
+# Trackers live in one worker process, so track ids are only stable with a
+# single worker: with MODEL_SERVER_WORKERS > 1, TRACKING_MODE is turned off
+# at startup and track=1 requests are rejected with 400.
+TRACKING_MODE = os.environ.get('TRACKING_MODE', '0') == '1'
+TRACK_MAX_INTERVAL = int(os.environ.get('TRACK_MAX_INTERVAL', '5'))
+TRACK_MOTION_THRESHOLD = float(os.environ.get('TRACK_MOTION_THRESHOLD', '0.1'))
+TRACK_LOW_CONF = float(os.environ.get('TRACK_LOW_CONF', '0.1'))
+TRACK_MAX_AGE = int(os.environ.get('TRACK_MAX_AGE', '30'))
+
+def resolve_model_path(backend, precision='fp32', model_path=MODEL_PATH):
+    """Path of the weights for a backend, following Ultralytics export naming"""
+    base, _ = os.path.splitext(model_path)
+    if precision == 'int8':
+        if backend != 'onnxruntime':
+            raise ValueError("INFERENCE_PRECISION=int8 requires INFERENCE_BACKEND=onnxruntime")
+        return f"{base}_int8.onnx"
+    if precision != 'fp32':
+        raise ValueError(f"Unsupported INFERENCE_PRECISION: {precision}. Use fp32 or int8")
+    paths = {
+        'torch': model_path,
+        'onnxruntime': f"{base}.onnx",
+        'openvino': f"{base}_openvino_model",
+    }
+    if backend not in paths:
+        raise ValueError(
+            f"Unsupported INFERENCE_BACKEND: {backend}. Use one of: {', '.join(paths)}"
+        )
+    return paths[backend]
+
 # Global model variable (loaded once on container startup)
 model = None
 
+# Class-id -> name lookup array, built once from model.names
+class_names = None
+
+# Class name -> id, for the `classes` request option
+class_ids = {}
+
+# Letterbox buffers, reused once a frame has left the model
+frame_buffers = BufferPool()
+
+# Current rung of the input size ladder
+ladder = ResolutionLadder(IMGSZ_LADDER, target_wait_ms=IMGSZ_TARGET_WAIT_MS)
+
+# Last inferred frame per session, for frame skipping
+sessions = SessionStore(max_sessions=SESSION_CACHE_SIZE, ttl_seconds=SESSION_TTL_SECONDS)
+
+# Set once warm-up has finished; /ping reports unhealthy until then
+ready = threading.Event()
+warmup_error = None
+
+def limit_backend_threads(backend, threads):
+    """
+    Give the sessions Ultralytics creates for backend at most `threads` intra-op threads
+    Ultralytics builds them itself without a thread setting, so the runtime's
+    session class is swapped for one that adds it
+    """
+    if threads <= 0:
+        return
+    if backend == 'onnxruntime':
+        import onnxruntime
+
+        class ThreadLimitedSession(onnxruntime.InferenceSession):
+            def __init__(self, path_or_bytes, sess_options=None, *args, **kwargs):
+                sess_options = sess_options or onnxruntime.SessionOptions()
+                if not sess_options.intra_op_num_threads:
+                    sess_options.intra_op_num_threads = threads
+                super().__init__(path_or_bytes, sess_options, *args, **kwargs)
+
+        onnxruntime.InferenceSession = ThreadLimitedSession
+    elif backend == 'openvino':
+        import openvino
+
+        class ThreadLimitedCore(openvino.Core):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                # A plugin default, so it also applies when AUTO picks the CPU
+                self.set_property('CPU', {'INFERENCE_NUM_THREADS': threads})
+
+        openvino.Core = ThreadLimitedCore
+
+def build_predictor_before_fork():
+    """
+    Set up the Ultralytics predictor in a preloading gunicorn master
+    The predictor copies the model and fuses Conv+BN into new tensors when
+    it is first used; done in each worker, that gives every worker a private
+    copy of the weights. One tiny predict here builds them once, before
+    fork, so workers share them copy-on-write. CPU only: CUDA cannot be
+    initialized before fork, so GPU workers still build their own.
+    """
+    import torch
+    if torch.cuda.is_available():
+        print("CUDA available: each worker sets up its predictor after fork")
+        return
+    threads = torch.get_num_threads()
+    # OpenMP thread pools started in the master do not survive fork
+    torch.set_num_threads(1)
+    try:
+        model(np.full((STRIDE, STRIDE, 3), PAD_VALUE, dtype=np.uint8), imgsz=STRIDE, verbose=False)
+    finally:
+        torch.set_num_threads(threads)
+
 def load_model():
     """Load YOLOv11-nano model on startup"""
-    global model
+    global model, class_names, class_ids
     try:
-        print("Loading YOLOv11-nano model...")
-        # Model is pre-downloaded to /opt/program/yolo11n.pt during Docker build
-        model_path = '/opt/program/yolo11n.pt'
-        model = YOLO(model_path)
+        print(f"Loading YOLOv11-nano model ({INFERENCE_BACKEND} backend, {INFERENCE_PRECISION})...")
+        limit_backend_threads(INFERENCE_BACKEND, INFERENCE_THREADS)
+        model_path = resolve_model_path(INFERENCE_BACKEND, INFERENCE_PRECISION)
+        model = YOLO(model_path, task='detect')
+        class_names = build_class_names(model.names)
+        class_ids = {name: class_id for class_id, name in model.names.items()}
+        if INFERENCE_BACKEND == 'torch' and os.environ.get('WARMUP_AFTER_FORK') == '1':
+            build_predictor_before_fork()
         print(f"Model loaded successfully from {model_path}!")
         return True
     except Exception as e:
@@ -33,117 +244,582 @@ def load_model():
         traceback.print_exc()
         return False
 
+def run_batch(items):
+    """
+    Run batched forward passes over (image, InferenceOptions) items
+    Items with the same options and input size (the letterboxed long side)
+    share one model call. Returns
+    (Detections, timings) per item, where timings holds that call's forward
+    and NMS time in ms (each request waited for all of it).
+    """
+    groups = {}
+    for index, (image, options) in enumerate(items):
+        groups.setdefault((options, max(image.shape[:2])), []).append(index)
+
+    outputs = [None] * len(items)
+    for (options, imgsz), indices in groups.items():
+        images = [items[i][0] for i in indices]
+        results = model(images, imgsz=imgsz, verbose=False, **options.predict_kwargs())
+        # Ultralytics reports per-image averages over the batch
+        speed = results[0].speed if results else {}
+        timings = {
+            'forward': ((speed.get('preprocess') or 0) + (speed.get('inference') or 0)) * len(results),
+            'nms': (speed.get('postprocess') or 0) * len(results),
+        }
+        BATCH_SIZE.observe(len(results))
+        for index, result in zip(indices, results):
+            outputs[index] = (from_result(result), timings)
+    return outputs
+
+# Encoded images are decoded; raw frames are wrapped in place without a decode
+ENCODED_CONTENT_TYPES = ['image/jpeg', 'image/png', 'application/octet-stream']
+RAW_RGB_CONTENT_TYPE = 'application/x-raw-rgb'
+NPY_CONTENT_TYPE = 'application/x-npy'
+SUPPORTED_CONTENT_TYPES = ENCODED_CONTENT_TYPES + [RAW_RGB_CONTENT_TYPE, NPY_CONTENT_TYPE]
+
+def _int_param(params, key):
+    value = params.get(key)
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{key} must be an integer, got {value!r}")
+
+def prepare_frame(image_bytes, timer, content_type='image/jpeg', params=None, imgsz=MODEL_IMGSZ):
+    """
+    Turn request bytes into a letterboxed frame in a pooled buffer; pass it
+    to release_frame() once the model is done with it.
+
+    JPEG/PNG are decoded near model resolution. application/x-raw-rgb
+    (width/height/stride from X-Image-* headers or request options) and
+    application/x-npy are wrapped with np.frombuffer and resized straight
+    from the request body.
+    """
+    params = params or {}
+    rgb = content_type in (RAW_RGB_CONTENT_TYPE, NPY_CONTENT_TYPE)
+    with timer.stage('decode'):
+        if content_type == RAW_RGB_CONTENT_TYPE:
+            width, height = _int_param(params, 'width'), _int_param(params, 'height')
+            if width is None or height is None:
+                raise ValueError("application/x-raw-rgb requires width and height")
+            image = wrap_raw_rgb(image_bytes, width, height, _int_param(params, 'stride'))
+        elif content_type == NPY_CONTENT_TYPE:
+            image = wrap_npy(image_bytes)
+        else:
+            image, original_size = decode_image(image_bytes, imgsz)
+        if rgb:
+            original_size = (image.shape[1], image.shape[0])
+    with timer.stage('preprocess'):
+        frame = letterbox(image, original_size, imgsz, out=frame_buffers.acquire(imgsz), rgb=rgb)
+    return frame
+
+def release_frame(frame):
+    """Return a frame's letterbox buffer to the pool"""
+    frame_buffers.release(max(frame.image.shape[:2]), frame.image)
+
+batcher = MicroBatcher(run_batch, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS,
+                       max_queue_size=QUEUE_MAX_SIZE)
+
+decode_stage = Stage('decode', PIPELINE_DECODE_WORKERS, PIPELINE_DECODE_QUEUE)
+serialize_stage = Stage('serialize', PIPELINE_SERIALIZE_WORKERS)
+
+REGISTRY.register(Gauge(
+    "inference_queue_depth",
+    "Requests waiting for each pipeline stage",
+    lambda: {
+        ('decode',): decode_stage.depth,
+        ('inference',): batcher.pending,
+        ('serialize',): serialize_stage.depth,
+    },
+    labelnames=("stage",),
+))
+
+REGISTRY.register(Gauge(
+    "inference_imgsz",
+    "Model input size currently chosen for new requests",
+    lambda: ladder.current,
+))
+
+def request_deadline(params, timer):
+    """
+    time.monotonic() by which the response is useless, or None
+    Counted from nginx's X-Request-Start stamp when present, so time spent
+    waiting for a free worker thread counts against the budget.
+    """
+    raw = params.get('deadline_ms')
+    budget_ms = REQUEST_DEADLINE_MS
+    if raw is not None and raw != '':
+        try:
+            budget_ms = float(raw)
+        except ValueError:
+            raise ValueError(f"Invalid deadline_ms: {raw!r}")
+        if budget_ms <= 0:
+            raise ValueError(f"Invalid deadline_ms: {raw!r} (expected > 0)")
+    if budget_ms <= 0:
+        return None
+    deadline = timer.started + budget_ms / 1000.0
+    start = params.get('request_start', '')
+    if start.startswith('t='):
+        try:
+            queued = time.time() - float(start[2:]) - (time.monotonic() - timer.started)
+            deadline -= max(0.0, queued)
+        except ValueError:
+            pass
+    return deadline
+
+def overloaded(error):
+    """Response for a request shed by admission control: 429 if the queue is full, else 503"""
+    DROPPED.inc(error.reason)
+    return {
+        "success": False,
+        "error": str(error),
+        "retry_after": round(error.retry_after, 3)
+    }, 429 if isinstance(error, QueueFull) else 503, None
+
+def superseded(error):
+    """Response for a frame replaced by a newer one from the same session (200, no predictions)"""
+    DROPPED.inc(error.reason)
+    return {
+        "success": False,
+        "status": "superseded",
+        "error": str(error)
+    }, 200, None
+
+def warmup_frames():
+    """Letterboxed synthetic frames, one per distinct model input shape to warm up"""
+    frames = {}
+    for imgsz in WARMUP_SIZES:
+        for aspect_w, aspect_h in WARMUP_ASPECTS:
+            # Long side at imgsz, as a phone frame is after decode_image
+            scale = imgsz / max(aspect_w, aspect_h)
+            width, height = max(1, round(aspect_w * scale)), max(1, round(aspect_h * scale))
+            image = np.full((height, width, 3), 114, dtype=np.uint8)
+            frame = letterbox(image, (width, height), imgsz)
+            frames.setdefault(frame.image.shape[:2], frame.image)
+    return frames
+
+def warmup_batch_sizes():
+    """
+    WARMUP_BATCH_SIZES capped at BATCH_MAX_SIZE: no model call is larger, and
+    the queue always admits that many (larger ones would raise QueueFull)
+    """
+    return sorted({max(1, min(size, batcher.max_batch_size)) for size in WARMUP_BATCH_SIZES})
+
+def warm_up():
+    """
+    Push synthetic frames through the batcher at every configured input
+    shape and batch size, then mark the server ready. Going through the
+    batcher keeps model calls on one thread even if real requests arrive
+    meanwhile; if they already fill the queue, the rest of warm-up is
+    skipped. Any other failure leaves /ping unhealthy with the error.
+    """
+    global warmup_error
+    start = time.perf_counter()
+    passes = 0
+    batch_sizes = warmup_batch_sizes()
+    try:
+        frames = warmup_frames()
+        for (height, width), frame in frames.items():
+            shape_start = time.perf_counter()
+            for batch_size in batch_sizes:
+                for _ in range(WARMUP_ITERATIONS):
+                    futures = [batcher.submit_async((frame, DEFAULT_OPTIONS)) for _ in range(batch_size)]
+                    for future in futures:
+                        future.result()
+                    passes += 1
+            print(f"Warm-up {width}x{height}: {time.perf_counter() - shape_start:.2f}s")
+        print(f"Warm-up complete in {time.perf_counter() - start:.2f}s "
+              f"({passes} passes, {len(frames)} shapes, batch sizes {batch_sizes})")
+    except Overloaded as e:
+        print(f"WARNING: warm-up stopped after {passes} passes, requests already fill the queue: {e}")
+    except Exception as e:
+        warmup_error = str(e)
+        print(f"ERROR: warm-up failed, /ping will report unhealthy: {warmup_error}")
+        traceback.print_exc()
+        return
+    ready.set()
+
+def start_warm_up():
+    """Run warm-up on a background thread so /ping can answer 503 meanwhile"""
+    if model is None or WARMUP_ITERATIONS <= 0:
+        ready.set()
+        return
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+def health():
+    """Readiness status shared by the WSGI and ASGI servers: (body, status)"""
+    if model is None:
+        return {"status": "unhealthy", "error": "Model not loaded"}, 503
+    if warmup_error is not None:
+        return {"status": "unhealthy", "error": f"Warm-up failed: {warmup_error}"}, 503
+    if not ready.is_set():
+        return {"status": "warming_up"}, 503
+    return {"status": "healthy"}, 200
+
+def reusable_detections(state, thumb, options, frame):
+    """A session's cached detections if this frame is close enough to reuse them"""
+    if state is None or SESSION_DIFF_THRESHOLD <= 0:
+        return None
+    if state.options != options or state.image_size != (frame.width, frame.height):
+        return None
+    if state.reuse_count >= SESSION_MAX_REUSE:
+        return None
+    if frame_difference(thumb, state.thumbnail) >= SESSION_DIFF_THRESHOLD:
+        return None
+    state.reuse_count += 1
+    return state.detections
+
+def _tracking_param(params):
+    value = params.get('track')
+    if value is None or value == '':
+        return TRACKING_MODE
+    if value.lower() in ('1', 'true', 'yes'):
+        if SERVER_WORKERS > 1:
+            raise ValueError(f"track=1 needs a single worker (MODEL_SERVER_WORKERS={SERVER_WORKERS})")
+        return True
+    if value.lower() in ('0', 'false', 'no'):
+        return False
+    raise ValueError(f"Invalid track: {value!r}")
+
+def propagated_detections(state, thumb, options, frame):
+    """Tracker output for a non-key frame, or None when this frame must be a keyframe"""
+    if state is None or state.tracker is None:
+        return None
+    if state.options != options or state.image_size != (frame.width, frame.height):
+        return None
+    tracker = state.tracker
+    with tracker.lock:
+        if frame_difference(thumb, state.thumbnail) >= TRACK_MOTION_THRESHOLD:
+            tracker.force_keyframe()
+            return None
+        if tracker.keyframe_due():
+            return None
+        detections = tracker.predict()
+    xyxy = detections.xyxy
+    np.clip(xyxy[:, 0::2], 0, frame.width, out=xyxy[:, 0::2])
+    np.clip(xyxy[:, 1::2], 0, frame.height, out=xyxy[:, 1::2])
+    return detections
+
+def track_keyframe(state, detections, options, frame):
+    """Feed keyframe detections to the session's tracker (created on first use)"""
+    tracker = state.tracker if state is not None else None
+    if tracker is None or state.image_size != (frame.width, frame.height):
+        tracker = Tracker(max_age=TRACK_MAX_AGE, max_interval=TRACK_MAX_INTERVAL)
+    with tracker.lock:
+        tracker.high_conf = options.conf
+        return tracker, tracker.update(detections)
+
+class Invocation:
+    """One /invocations request as it moves through the pipeline stages"""
+
+    __slots__ = ('content_type', 'image_bytes', 'timer', 'params', 'accept', 'result',
+                 'options', 'session_id', 'tracking', 'deadline', 'imgsz', 'frame',
+                 'thumb', 'state', 'stage_start', 'batch_ms')
+
+    def __init__(self, content_type, image_bytes, timer, params, accept):
+        self.content_type = content_type
+        self.image_bytes = image_bytes
+        self.timer = timer
+        self.params = params
+        self.accept = accept
+        self.result = Future()
+        self.frame = None
+        self.thumb = None
+        self.state = None
+        self.batch_ms = 0.0
+        self.stage_start = time.perf_counter()
+
+def submit_invocation(content_type, image_bytes, timer=None, params=None, accept=None):
+    """
+    Start one /invocations request down the staged pipeline (see pipeline.py)
+    params holds request options from collect_params() (conf, iou, ...) and
+    accept the client's Accept header (JSON or msgpack, see encoding.py).
+    Returns a Future of (response_bytes, status_code, headers). Stage timings
+    go to the /metrics histograms and back to the caller as a Server-Timing
+    header.
+    """
+    call = Invocation(content_type, image_bytes, timer or StageTimer(), params or {}, accept)
+    try:
+        decode_stage.submit(_decode_step, call)
+    except QueueFull as e:
+        call.result.set_result(respond(*overloaded(e), call.timer, accept))
+    return call.result
+
+def handle_invocation(content_type, image_bytes, timer=None, params=None, accept=None):
+    """Run one /invocations request and wait for it: (response_bytes, status_code, headers)"""
+    return submit_invocation(content_type, image_bytes, timer, params, accept).result()
+
+def respond(body, status, detections, timer, accept=None):
+    """Encode a response body and build its headers: (response_bytes, status_code, headers)"""
+    media_type = negotiate(accept)
+    with timer.stage('serialize'):
+        content = encode(body, detections, class_names, media_type)
+
+    REQUESTS.inc(str(status))
+    timer.observe_into(STAGE_SECONDS)
+    server_timing = timer.server_timing()
+    # The only response header SageMaker passes back to InvokeEndpoint callers
+    custom_attributes = f"server-timing={server_timing}"
+    headers = {
+        'Content-Type': media_type,
+        'Server-Timing': server_timing,
+    }
+    if "retry_after" in body:
+        retry_after = str(max(1, math.ceil(body["retry_after"])))
+        headers['Retry-After'] = retry_after
+        custom_attributes = f"retry-after={retry_after};{custom_attributes}"
+    headers['X-Amzn-SageMaker-Custom-Attributes'] = custom_attributes
+    return content, status, headers
+
+def _internal_error(e):
+    # Log error and return error response
+    error_msg = str(e)
+    print(f"Error during inference: {error_msg}")
+    traceback.print_exc()
+
+    return {
+        "success": False,
+        "error": error_msg
+    }, 500, None
+
+def _decode_step(call):
+    """Decode stage: validate and decode, then hand the frame to the model or finish early"""
+    call.timer.record('decode_queue', (time.perf_counter() - call.stage_start) * 1000)
+    try:
+        outcome = _prepare(call)
+    except Exception as e:
+        outcome = _internal_error(e)
+    if outcome is not None:
+        _to_serialize(call, outcome=outcome)
+
+def _prepare(call):
+    """
+    Validate, decode and gate one request: (body_dict, status_code, detections)
+    when it is answered without the model, or None once it is queued for it
+    """
+    timer, params = call.timer, call.params
+
+    # Check if model is loaded
+    if model is None:
+        return {
+            "success": False,
+            "error": "Model not loaded"
+        }, 500, None
+
+    # Accept JPEG, PNG, generic binary data, or raw RGB pixels
+    if call.content_type not in SUPPORTED_CONTENT_TYPES:
+        return {
+            "success": False,
+            "error": f"Unsupported content type: {call.content_type}. Use {', '.join(SUPPORTED_CONTENT_TYPES)}"
+        }, 400, None
+
+    # Validate image data
+    if not call.image_bytes or len(call.image_bytes) == 0:
+        return {
+            "success": False,
+            "error": "Empty image data"
+        }, 400, None
+
+    # Optional NMS settings (conf, iou, classes, max_det) and tracking mode
+    try:
+        call.options = parse_options(params, class_ids)
+        call.session_id = params.get('session')
+        call.tracking = bool(call.session_id) and _tracking_param(params)
+        call.deadline = request_deadline(params, timer)
+    except ValueError as e:
+        return {
+            "success": False,
+            "error": f"Invalid inference options: {str(e)}"
+        }, 400, None
+
+    # Do not spend a decode on a frame that is already too late
+    if call.deadline is not None and time.monotonic() > call.deadline:
+        return overloaded(Expired("Request deadline passed before processing", batcher.estimated_wait()))
+
+    # Decode and letterbox image at a size the current load allows
+    call.imgsz = ladder.choose(batcher.estimated_wait())
+    try:
+        call.frame = prepare_frame(call.image_bytes, timer, call.content_type, params, call.imgsz)
+    except ValueError as e:
+        return {
+            "success": False,
+            "error": f"Invalid image format: {str(e)}"
+        }, 400, None
+
+    # Skip the model when the session's scene has not changed, or (tracking
+    # mode) when this is not a keyframe
+    if call.session_id:
+        with timer.stage('gate'):
+            call.thumb = thumbnail(call.frame.image)
+            call.state = sessions.get(call.session_id)
+            if call.tracking:
+                detections = propagated_detections(call.state, call.thumb, call.options, call.frame)
+            else:
+                detections = reusable_detections(call.state, call.thumb, call.options, call.frame)
+        if detections is not None:
+            SESSION_FRAMES.inc('tracked' if call.tracking else 'reused')
+            release_frame(call.frame)
+            return _success(call, detections, reused=True)
+        SESSION_FRAMES.inc('inferred')
+
+    # Run inference (batched with any concurrent requests)
+    options = call.options
+    model_options = options._replace(conf=min(options.conf, TRACK_LOW_CONF)) if call.tracking else options
+    mailbox = call.session_id if SESSION_LATEST_WINS else None
+    try:
+        future = batcher.submit_async((call.frame.image, model_options), deadline=call.deadline, key=mailbox)
+    except Overloaded as e:
+        release_frame(call.frame)
+        return overloaded(e)
+    call.stage_start = time.perf_counter()
+    future.add_done_callback(lambda done: _to_serialize(call, batch_future=done))
+    return None
+
+def _to_serialize(call, outcome=None, batch_future=None):
+    # Runs on a decode thread or the batching thread; hand off at once
+    if batch_future is not None:
+        # Time in the batcher; forward and NMS are split out of it later
+        call.batch_ms = (time.perf_counter() - call.stage_start) * 1000
+    call.stage_start = time.perf_counter()
+    serialize_stage.submit(_serialize_step, call, outcome, batch_future)
+
+def _serialize_step(call, outcome, batch_future):
+    """Serialize stage: finish the request and resolve its future"""
+    call.timer.record('serialize_queue', (time.perf_counter() - call.stage_start) * 1000)
+    try:
+        if batch_future is not None:
+            outcome = _after_model(call, batch_future)
+        response = respond(*outcome, call.timer, call.accept)
+    except Exception as e:
+        response = respond(*_internal_error(e), call.timer, call.accept)
+    call.result.set_result(response)
+
+def _after_model(call, batch_future):
+    """Map the model's boxes back to the original image and update the session"""
+    timer, frame = call.timer, call.frame
+    release_frame(frame)
+    try:
+        detections, batch_timings = batch_future.result()
+    except Overloaded as e:
+        return overloaded(e)
+    except Superseded as e:
+        return superseded(e)
+    timer.record('queue', call.batch_ms - batch_timings['forward'] - batch_timings['nms'])
+    timer.record('forward', batch_timings['forward'])
+    timer.record('nms', batch_timings['nms'])
+
+    # Map boxes back to the original image
+    with timer.stage('postprocess'):
+        detections = scale_to_original(detections, frame)
+
+    tracker = None
+    if call.tracking:
+        with timer.stage('track'):
+            tracker, detections = track_keyframe(call.state, detections, call.options, frame)
+    if call.session_id:
+        sessions.put(call.session_id,
+                     SessionState(call.thumb, detections, call.options, (frame.width, frame.height), tracker))
+    return _success(call, detections, reused=False)
+
+def _success(call, detections, reused):
+    # Predictions are added by the encoder (Ultralytics format for JSON)
+    response = {
+        "success": True,
+        "image": {
+            "width": call.frame.width,
+            "height": call.frame.height
+        },
+        "imgsz": call.imgsz
+    }
+    if call.tracking:
+        response["keyframe"] = not reused
+    elif call.session_id:
+        response["reused"] = reused
+
+    return response, 200, detections
+
 @app.route('/ping', methods=['GET'])
 def ping():
     """
     Health check endpoint required by SageMaker
-    Returns 200 if the model is loaded and ready
+    Returns 200 once the model is loaded and warmed up, 503 before that
     """
-    if model is not None:
-        return jsonify({"status": "healthy"}), 200
-    else:
-        return jsonify({"status": "unhealthy", "error": "Model not loaded"}), 503
+    body, status = health()
+    return jsonify(body), status
 
 @app.route('/invocations', methods=['POST'])
 def invocations():
     """
     Inference endpoint required by SageMaker
-    Accepts: image/jpeg or application/octet-stream (JPEG bytes)
-    Returns: JSON with detection results in Ultralytics format
+    Accepts: image/jpeg or application/octet-stream (JPEG bytes), or
+    already-decoded pixels as application/x-raw-rgb or application/x-npy
+    Options: conf, iou, classes, max_det, deadline_ms (query string or custom attributes),
+    and session (or X-Session-Id) to reuse detections for unchanged frames,
+    plus track=1 to track objects between keyframes
+    Returns: JSON with detection results in Ultralytics format, or packed
+    msgpack when the Accept header asks for application/x-msgpack
     """
-    try:
-        # Check if model is loaded
-        if model is None:
-            return jsonify({
-                "success": False,
-                "error": "Model not loaded"
-            }), 500
-
-        # Get image data from request
-        # Accept JPEG, PNG, or generic binary data
-        if request.content_type in ['image/jpeg', 'image/png', 'application/octet-stream']:
-            image_bytes = request.data
-        else:
-            return jsonify({
-                "success": False,
-                "error": f"Unsupported content type: {request.content_type}. Use image/jpeg, image/png, or application/octet-stream"
-            }), 400
-
-        # Validate image data
-        if not image_bytes or len(image_bytes) == 0:
-            return jsonify({
-                "success": False,
-                "error": "Empty image data"
-            }), 400
-
-        # Load image
-        try:
-            image = Image.open(io.BytesIO(image_bytes))
-            image = image.convert('RGB')  # Ensure RGB format
-            image_width, image_height = image.size
-        except Exception as e:
-            return jsonify({
-                "success": False,
-                "error": f"Invalid image format: {str(e)}"
-            }), 400
-
-        # Run inference
-        results = model(image, verbose=False)
-        
-        # Parse results
-        predictions = []
-        for result in results:
-            boxes = result.boxes
-            for box in boxes:
-                # Get bounding box coordinates (xyxy format)
-                x1, y1, x2, y2 = box.xyxy[0].tolist()
-                
-                # Get class and confidence
-                class_id = int(box.cls[0].item())
-                class_name = model.names[class_id]
-                confidence = float(box.conf[0].item())
-                
-                # Create prediction object in Ultralytics format
-                prediction = {
-                    "class": class_name,
-                    "confidence": confidence,
-                    "box": {
-                        "x1": int(x1),
-                        "y1": int(y1),
-                        "x2": int(x2),
-                        "y2": int(y2)
-                    }
-                }
-                predictions.append(prediction)
-
-        # Return response in Ultralytics format
-        response = {
-            "success": True,
-            "predictions": predictions,
-            "image": {
-                "width": image_width,
-                "height": image_height
-            }
-        }
-        
-        return jsonify(response), 200
+    timer = StageTimer()
+    with timer.stage('read'):
+        image_bytes = request.get_data()
+    params = collect_params(request.args, request.headers)
+    content, status, headers = handle_invocation(
+        request.content_type, image_bytes, timer, params, request.headers.get('Accept')
+    )
+    return Response(content, status=status, headers=headers)
 
-    except Exception as e:
-        # Log error and return error response
-        error_msg = str(e)
-        print(f"Error during inference: {error_msg}")
-        traceback.print_exc()
-        
-        return jsonify({
-            "success": False,
-            "error": error_msg
-        }), 500
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Per-stage latency histograms and request counters (Prometheus text format)"""
+    return Response(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
-# Load model when the app starts
-print("Starting inference server...")
-if not load_model():
-    print("WARNING: Model failed to load!")
+def check_session_features():
+    """Turn off session features that need all of a session's frames in this process"""
+    global SESSION_DIFF_THRESHOLD, TRACKING_MODE
+    if SERVER_WORKERS <= 1:
+        return
+    if SESSION_DIFF_THRESHOLD > 0:
+        print(f"WARNING: frame reuse needs a single worker (MODEL_SERVER_WORKERS={SERVER_WORKERS}); "
+              f"disabling it")
+        SESSION_DIFF_THRESHOLD = 0.0
+    if TRACKING_MODE:
+        print(f"WARNING: tracking needs a single worker (MODEL_SERVER_WORKERS={SERVER_WORKERS}); "
+              f"disabling TRACKING_MODE")
+        TRACKING_MODE = False
+
+def startup():
+    """Load the model and start warm-up"""
+    print("Starting inference server...")
+    check_session_features()
+    if not load_model():
+        print("WARNING: Model failed to load!")
+
+    # A preloading gunicorn master must not run the model before forking (CUDA
+    # cannot be initialized across fork); gunicorn.conf.py warms each worker instead
+    if os.environ.get('WARMUP_AFTER_FORK') != '1':
+        start_warm_up()
+
+def main(argv=None):
+    """python -m inference [serve | autotune ...]"""
+    import autotune
+    parser = argparse.ArgumentParser(description='YOLOv11-nano inference server')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser('serve', help='Run the Flask development server on port 8080 (default)')
+    tune = subparsers.add_parser('autotune', help='Measure serving settings on this machine and write a profile')
+    autotune.add_arguments(tune)
+    args = parser.parse_args(argv)
+
+    if args.command == 'autotune':
+        return autotune.tune(args, resolve_model_path)
 
-if __name__ == '__main__':
     # For local testing
+    startup()
     app.run(host='0.0.0.0', port=8080, debug=True)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
+else:
+    # Load model when the app is imported (gunicorn, benchmarks)
+    startup()
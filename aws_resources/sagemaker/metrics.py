@@ -0,0 +1,187 @@
+"""
+Low-overhead latency metrics for the inference server
+Per-request stage timers, fixed-bucket histograms and counters rendered in
+the Prometheus text exposition format for /metrics
+
+Metrics are kept per process; with several gunicorn workers each worker
+reports its own counts.
+"""
+
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# Seconds; spans sub-millisecond stages up to a slow multi-second request
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                # [per-bucket counts..., +Inf count], sum
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for labels, counts, total in sorted(snapshot):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float('inf') else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, ('le', le))} {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {total}")
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        for labels, value in snapshot:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Gauge:
+    """
+    Current value read from a callback at scrape time
+    With labelnames the callback returns {label values tuple: value}.
+    """
+
+    def __init__(self, name, documentation, function, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+        self.labelnames = tuple(labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        values = self.function()
+        if not self.labelnames:
+            values = {(): values}
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class StageTimer:
+    """
+    Collects per-stage durations for one request
+    Stages keep their insertion order so Server-Timing reads like the pipeline.
+    started is the time.monotonic() the request arrived, for deadlines.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.started = time.monotonic()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000)
+
+    def record(self, name, duration_ms):
+        self.stages[name] = self.stages.get(name, 0.0) + max(0.0, duration_ms)
+
+    def server_timing(self):
+        """Server-Timing header value, e.g. 'decode;dur=1.20, forward;dur=31.05'"""
+        return ", ".join(f"{name};dur={ms:.2f}" for name, ms in self.stages.items())
+
+    def observe_into(self, histogram):
+        for name, ms in self.stages.items():
+            histogram.observe(ms / 1000.0, name)
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "inference_stage_duration_seconds",
+    "Time spent in each /invocations stage",
+    labelnames=("stage",),
+))
+
+REQUESTS = REGISTRY.register(Counter(
+    "inference_requests_total",
+    "/invocations requests by HTTP status",
+    labelnames=("status",),
+))
+
+BATCH_SIZE = REGISTRY.register(Histogram(
+    "inference_batch_size",
+    "Images per batched forward pass",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+))
+
+SESSION_FRAMES = REGISTRY.register(Counter(
+    "inference_session_frames_total",
+    "Frames from clients sending a session id, by whether inference ran or detections were reused",
+    labelnames=("outcome",),
+))
+
+DROPPED = REGISTRY.register(Counter(
+    "inference_requests_dropped_total",
+    "Requests answered without inference by admission control, by reason",
+    labelnames=("reason",),
+))
@@ -0,0 +1,122 @@
+"""
+Per-request inference options for /invocations
+conf, iou, classes and max_det are read from the query string (local
+testing) or from X-Amzn-SageMaker-Custom-Attributes, the one request header
+InvokeEndpoint forwards to the container, e.g.:
+
+  X-Amzn-SageMaker-Custom-Attributes: conf=0.4;classes=person,chair;max_det=20
+
+Options are applied inside NMS, so filtered-out boxes are never post-processed
+or serialized.
+"""
+
+import os
+from typing import NamedTuple, Optional, Tuple
+
+CUSTOM_ATTRIBUTES_HEADER = 'X-Amzn-SageMaker-Custom-Attributes'
+
+# Request headers read as options: geometry of application/x-raw-rgb bodies,
+# the session id for frame skipping, the client's latency budget and nginx's
+# arrival timestamp (all but the last also accepted as options)
+PARAM_HEADERS = {
+    'X-Image-Width': 'width',
+    'X-Image-Height': 'height',
+    'X-Image-Stride': 'stride',
+    'X-Session-Id': 'session',
+    'X-Request-Deadline-Ms': 'deadline_ms',
+    'X-Request-Start': 'request_start',
+}
+
+# Server-wide defaults (Ultralytics' own defaults unless overridden)
+DEFAULT_CONF = float(os.environ.get('DEFAULT_CONF', '0.25'))
+DEFAULT_IOU = float(os.environ.get('DEFAULT_IOU', '0.7'))
+DEFAULT_MAX_DET = int(os.environ.get('DEFAULT_MAX_DET', '300'))
+
+
+class InferenceOptions(NamedTuple):
+    """NMS settings for one request; hashable so equal options can share a batch"""
+    conf: float = DEFAULT_CONF
+    iou: float = DEFAULT_IOU
+    classes: Optional[Tuple[int, ...]] = None
+    max_det: int = DEFAULT_MAX_DET
+
+    def predict_kwargs(self):
+        # Always pass every option: older Ultralytics releases keep predictor
+        # args from the previous call when a key is omitted
+        return {
+            "conf": self.conf,
+            "iou": self.iou,
+            "classes": list(self.classes) if self.classes is not None else None,
+            "max_det": self.max_det,
+        }
+
+
+DEFAULT_OPTIONS = InferenceOptions()
+
+
+def parse_custom_attributes(value):
+    """'conf=0.4;classes=person,chair' -> {'conf': '0.4', 'classes': 'person,chair'}"""
+    params = {}
+    for part in (value or '').split(';'):
+        key, sep, val = part.partition('=')
+        if sep and key.strip():
+            params[key.strip().lower()] = val.strip()
+    return params
+
+
+def collect_params(query, headers):
+    """Merge query-string parameters, option headers and custom attributes (attributes win)"""
+    params = {key.lower(): value for key, value in query.items()}
+    for header, key in PARAM_HEADERS.items():
+        value = headers.get(header)
+        if value is not None:
+            params[key] = value.strip()
+    params.update(parse_custom_attributes(headers.get(CUSTOM_ATTRIBUTES_HEADER)))
+    return params
+
+
+def _number(params, key, cast, low, high):
+    raw = params.get(key)
+    if raw is None or raw == '':
+        return None
+    try:
+        value = cast(raw)
+    except ValueError:
+        raise ValueError(f"Invalid {key}: {raw!r}")
+    if not low <= value <= high:
+        raise ValueError(f"Invalid {key}: {raw!r} (expected {low} to {high})")
+    return value
+
+
+def parse_options(params, class_ids_by_name):
+    """
+    Build InferenceOptions from request parameters
+    classes accepts COCO names or ids, comma-separated. Raises ValueError on
+    bad input so the caller can answer 400.
+    """
+    conf = _number(params, 'conf', float, 0.0, 1.0)
+    iou = _number(params, 'iou', float, 0.0, 1.0)
+    max_det = _number(params, 'max_det', int, 1, 1000)
+
+    classes = None
+    raw_classes = params.get('classes')
+    if raw_classes:
+        ids = set()
+        for token in raw_classes.split(','):
+            token = token.strip()
+            if not token:
+                continue
+            if token.isdigit() and int(token) in class_ids_by_name.values():
+                ids.add(int(token))
+            elif token in class_ids_by_name:
+                ids.add(class_ids_by_name[token])
+            else:
+                raise ValueError(f"Unknown class: {token!r}")
+        classes = tuple(sorted(ids)) or None
+
+    return InferenceOptions(
+        conf=DEFAULT_CONF if conf is None else conf,
+        iou=DEFAULT_IOU if iou is None else iou,
+        classes=classes,
+        max_det=DEFAULT_MAX_DET if max_det is None else max_det,
+    )
@@ -0,0 +1,73 @@
+"""
+Building blocks for the staged /invocations pipeline
+
+A request moves through three stages, each with its own threads, so no
+stage waits on another:
+
+  decode pool     validate, decode and letterbox (OpenCV releases the GIL)
+  inference loop  the MicroBatcher's single batching thread
+  serialize pool  map boxes back, update session state, encode the response
+
+Request threads (or the ASGI event loop) only wait for the final future,
+so the model keeps running while the next frames decode and earlier
+responses serialize. Letterbox buffers come from a BufferPool and go back
+once their frame has left the model, since a decode thread moves on to the
+next request long before that.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from batching import QueueFull
+
+
+class Stage:
+    """
+    A thread pool with a bounded backlog
+    submit() raises QueueFull once max_queue jobs are waiting (0 =
+    unbounded); depth counts jobs submitted but not yet started.
+    """
+
+    def __init__(self, name, workers, max_queue=0):
+        self.name = name
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix=name)
+        self._depth = 0
+        self._lock = threading.Lock()
+
+    @property
+    def depth(self):
+        return self._depth
+
+    def submit(self, fn, *args):
+        with self._lock:
+            if self.max_queue and self._depth >= self.max_queue:
+                raise QueueFull(f"{self.name} queue is full ({self._depth} waiting)", 0.0)
+            self._depth += 1
+        return self._executor.submit(self._run, fn, args)
+
+    def _run(self, fn, args):
+        with self._lock:
+            self._depth -= 1
+        return fn(*args)
+
+
+class BufferPool:
+    """Free list of letterbox buffers keyed by input size"""
+
+    def __init__(self, max_per_key=16):
+        self.max_per_key = max_per_key
+        self._free = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key):
+        """A previously released buffer for key, or None (letterbox then allocates one)"""
+        with self._lock:
+            free = self._free.get(key)
+            return free.pop() if free else None
+
+    def release(self, key, buffer):
+        with self._lock:
+            free = self._free.setdefault(key, [])
+            if len(free) < self.max_per_key:
+                free.append(buffer)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+INT8 post-training quantization for the YOLOv11-nano ONNX model
+
+Calibrates ONNX Runtime static quantization on real frames, then compares the
+INT8 model against FP32 on the same frames:
+  - agreement: share of FP32 boxes the INT8 model also finds (IoU >= 0.5),
+    mean IoU of those pairs and how often their classes match
+  - latency: per-frame forward time of each model
+
+Usage:
+  python quantize.py --model yolo11n.onnx --images-dir ../backend/tests/integration/resized
+  python quantize.py --report-only --output yolo11n_int8.onnx
+
+The server loads the result with INFERENCE_BACKEND=onnxruntime INFERENCE_PRECISION=int8.
+"""
+
+import json
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from decode import PAD_VALUE, decode_image, letterbox, scale_to_original
+from detections import from_result, match_detections
+
+SCRIPT_DIR = Path(__file__).parent.absolute()
+DEFAULT_IMAGES_DIR = SCRIPT_DIR.parent / "backend" / "tests" / "integration" / "resized"
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+
+# YOLO11 Detect head (box/class convs, DFL and decode); quantizing it costs
+# most of the accuracy for little speed, so it stays in FP32 by default
+DEFAULT_EXCLUDE_PREFIX = '/model.23/'
+
+
+def find_images(directory):
+    paths = sorted(p for p in Path(directory).iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+    if not paths:
+        raise RuntimeError(f"No images found in {directory}")
+    return paths
+
+
+def load_frames(paths, imgsz):
+    """Decode and letterbox exactly as the server does"""
+    frames = []
+    for path in paths:
+        bgr, original_size = decode_image(path.read_bytes(), imgsz)
+        frames.append(letterbox(bgr, original_size, imgsz))
+    return frames
+
+
+def to_input_tensor(frame, imgsz):
+    """Pad a letterboxed frame to the square ONNX input and convert to NCHW float RGB"""
+    h, w = frame.image.shape[:2]
+    square = np.full((imgsz, imgsz, 3), PAD_VALUE, dtype=np.uint8)
+    top, left = (imgsz - h) // 2, (imgsz - w) // 2
+    square[top:top + h, left:left + w] = frame.image
+    chw = square[:, :, ::-1].transpose(2, 0, 1)
+    return np.ascontiguousarray(chw, dtype=np.float32)[None] / 255.0
+
+
+def quantize(model_path, output_path, frames, imgsz, exclude_prefix):
+    from onnxruntime.quantization import (
+        CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    )
+    import onnx
+
+    graph = onnx.load(str(model_path)).graph
+    input_name = graph.input[0].name
+    exclude = [node.name for node in graph.node
+               if exclude_prefix and node.name.startswith(exclude_prefix)]
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self):
+            self._tensors = iter([to_input_tensor(f, imgsz) for f in frames])
+
+        def get_next(self):
+            tensor = next(self._tensors, None)
+            return None if tensor is None else {input_name: tensor}
+
+    print(f"Calibrating on {len(frames)} frames ({len(exclude)} head nodes kept in FP32)...")
+    quantize_static(
+        str(model_path),
+        str(output_path),
+        FrameReader(),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+        nodes_to_exclude=exclude,
+    )
+    print(f"INT8 model written to {output_path}")
+
+
+def run_model(model_path, frames, imgsz):
+    """Run every frame through a model; returns (detections list, latencies in ms)"""
+    from ultralytics import YOLO
+
+    model = YOLO(str(model_path), task='detect')
+    model(frames[0].image, imgsz=imgsz, verbose=False)  # warm-up
+
+    detections, latencies = [], []
+    for frame in frames:
+        start = time.perf_counter()
+        result = model(frame.image, imgsz=imgsz, verbose=False)[0]
+        latencies.append((time.perf_counter() - start) * 1000)
+        detections.append(scale_to_original(from_result(result), frame))
+    return detections, latencies
+
+
+def compare(paths, fp32, int8, iou_threshold):
+    """Per-image and overall agreement of INT8 detections with FP32"""
+    images = []
+    total_ref = total_matched = total_class_match = 0
+    iou_sum = 0.0
+    for path, ref, cand in zip(paths, fp32, int8):
+        matches = match_detections(ref, cand, iou_threshold)
+        class_match = sum(1 for i, j, _ in matches if ref.class_ids[i] == cand.class_ids[j])
+        total_ref += len(ref)
+        total_matched += len(matches)
+        total_class_match += class_match
+        iou_sum += sum(iou for _, _, iou in matches)
+        images.append({
+            "name": path.name,
+            "fp32_detections": len(ref),
+            "int8_detections": len(cand),
+            "matched": len(matches),
+            "class_match": class_match,
+        })
+
+    return {
+        "fp32_detections": total_ref,
+        "matched": total_matched,
+        "recall_vs_fp32": round(total_matched / total_ref, 4) if total_ref else None,
+        "mean_iou": round(iou_sum / total_matched, 4) if total_matched else None,
+        "class_agreement": round(total_class_match / total_matched, 4) if total_matched else None,
+        "images": images,
+    }
+
+
+def latency_summary(latencies):
+    ordered = sorted(latencies)
+    return {
+        "mean_ms": round(sum(ordered) / len(ordered), 2),
+        "p50_ms": round(ordered[len(ordered) // 2], 2),
+        "max_ms": round(ordered[-1], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='INT8-quantize the YOLOv11 ONNX model and report accuracy/latency')
+    parser.add_argument('--model', default='yolo11n.onnx', help='FP32 ONNX model (dynamic export)')
+    parser.add_argument('--output', default=None, help='INT8 output path (default: <model>_int8.onnx)')
+    parser.add_argument('--images-dir', default=str(DEFAULT_IMAGES_DIR),
+                        help='Calibration/evaluation images (default: bundled integration images)')
+    parser.add_argument('--imgsz', type=int, default=640, help='Model input size')
+    parser.add_argument('--exclude-prefix', default=DEFAULT_EXCLUDE_PREFIX,
+                        help='Keep nodes with this name prefix in FP32 ("" to quantize everything)')
+    parser.add_argument('--iou', type=float, default=0.5, help='IoU threshold for matching boxes')
+    parser.add_argument('--report', default=None, help='Also write the report as JSON to this path')
+    parser.add_argument('--report-only', action='store_true', help='Skip calibration, only compare')
+    args = parser.parse_args()
+
+    model_path = Path(args.model)
+    output_path = Path(args.output) if args.output else model_path.with_name(f"{model_path.stem}_int8.onnx")
+
+    paths = find_images(args.images_dir)
+    frames = load_frames(paths, args.imgsz)
+
+    if not args.report_only:
+        quantize(model_path, output_path, frames, args.imgsz, args.exclude_prefix)
+
+    fp32, fp32_latency = run_model(model_path, frames, args.imgsz)
+    int8, int8_latency = run_model(output_path, frames, args.imgsz)
+
+    report = compare(paths, fp32, int8, args.iou)
+    report["latency"] = {"fp32": latency_summary(fp32_latency), "int8": latency_summary(int8_latency)}
+
+    print("\n" + "=" * 60)
+    print("INT8 vs FP32")
+    print("=" * 60)
+    print(f"Images:            {len(paths)}")
+    print(f"FP32 detections:   {report['fp32_detections']}")
+    print(f"Recall vs FP32:    {report['recall_vs_fp32']}")
+    print(f"Mean IoU:          {report['mean_iou']}")
+    print(f"Class agreement:   {report['class_agreement']}")
+    print(f"FP32 latency:      {report['latency']['fp32']['mean_ms']}ms mean, {report['latency']['fp32']['p50_ms']}ms p50")
+    print(f"INT8 latency:      {report['latency']['int8']['mean_ms']}ms mean, {report['latency']['int8']['p50_ms']}ms p50")
+    print("=" * 60)
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report: {args.report}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
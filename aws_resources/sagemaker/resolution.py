@@ -0,0 +1,64 @@
+"""
+Adaptive model input size for the inference server
+
+Under load the server steps down a ladder of input sizes (e.g. 640, 480,
+320) instead of letting the queue grow until requests time out, and steps
+back up once the backlog clears. Smaller inputs trade some small-object
+recall for a much cheaper forward pass; `python benchmark.py imgsz` shows
+the trade-off on the bundled images.
+"""
+
+import threading
+import time
+
+from decode import STRIDE
+
+
+def parse_ladder(value):
+    """'640,480,320' -> [640, 480, 320] (largest first); sizes must be multiples of the stride"""
+    sizes = sorted({int(v) for v in value.split(',') if v.strip()}, reverse=True)
+    if not sizes:
+        raise ValueError("IMGSZ_LADDER must list at least one size")
+    for size in sizes:
+        if size <= 0 or size % STRIDE:
+            raise ValueError(f"Invalid IMGSZ_LADDER size {size}: must be a positive multiple of {STRIDE}")
+    return sizes
+
+
+class ResolutionLadder:
+    """
+    Picks the input size for each request from the predicted queue wait
+
+    The predicted wait (queue depth times the recent batch duration, see
+    MicroBatcher.estimated_wait) is compared with target_wait_ms: above it
+    the ladder steps one size down, below half of it one size up. Steps are
+    at least dwell_seconds apart so the batch duration can settle at the
+    new size before the next decision.
+    """
+
+    def __init__(self, sizes, target_wait_ms=150.0, dwell_seconds=1.0):
+        self.sizes = list(sizes)
+        self.target_wait = target_wait_ms / 1000.0
+        self.dwell = dwell_seconds
+        self.level = 0
+        self._changed = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def current(self):
+        return self.sizes[self.level]
+
+    def choose(self, estimated_wait):
+        """Input size for a request arriving when the predicted wait is estimated_wait seconds"""
+        if len(self.sizes) == 1:
+            return self.sizes[0]
+        now = time.monotonic()
+        with self._lock:
+            if now - self._changed >= self.dwell:
+                if estimated_wait > self.target_wait and self.level < len(self.sizes) - 1:
+                    self.level += 1
+                    self._changed = now
+                elif estimated_wait < self.target_wait / 2 and self.level > 0:
+                    self.level -= 1
+                    self._changed = now
+            return self.sizes[self.level]
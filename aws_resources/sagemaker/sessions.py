@@ -0,0 +1,87 @@
+"""
+Per-session state for clients that stream frames (e.g. one phone walking
+down a corridor), keyed by a client-supplied session id
+
+SessionStore is a bounded LRU with a time-to-live, so abandoned sessions
+age out and memory stays flat no matter how many clients come and go.
+The frame-skipping gate compares a tiny grayscale thumbnail of each new
+frame with the session's last inferred frame and reuses its detections
+when the scene has barely changed.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# Side of the grayscale thumbnail used for scene-change checks
+THUMBNAIL_SIZE = 32
+
+
+class SessionState:
+    """What the gate remembers about a session's last inferred frame (and its tracks, in tracking mode)"""
+
+    __slots__ = ('thumbnail', 'detections', 'options', 'image_size', 'reuse_count', 'tracker')
+
+    def __init__(self, thumbnail, detections, options, image_size, tracker=None):
+        self.thumbnail = thumbnail
+        self.detections = detections
+        self.options = options
+        self.image_size = image_size
+        self.reuse_count = 0
+        self.tracker = tracker
+
+
+class SessionStore:
+    """Thread-safe LRU of session id -> state, dropping entries idle for ttl_seconds"""
+
+    def __init__(self, max_sessions=1024, ttl_seconds=30.0):
+        self.max_sessions = max_sessions
+        self.ttl = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            state, touched = entry
+            if now - touched > self.ttl:
+                del self._entries[session_id]
+                return None
+            self._entries[session_id] = (state, now)
+            self._entries.move_to_end(session_id)
+            return state
+
+    def put(self, session_id, state):
+        now = time.monotonic()
+        with self._lock:
+            self._entries[session_id] = (state, now)
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_sessions:
+                self._entries.popitem(last=False)
+            # Expired entries sit at the old end; trim them while we hold the lock
+            while self._entries:
+                oldest_id, (_, touched) = next(iter(self._entries.items()))
+                if now - touched <= self.ttl:
+                    break
+                del self._entries[oldest_id]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+def thumbnail(bgr):
+    """Downsampled grayscale copy of a frame for cheap scene-change checks"""
+    gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, (THUMBNAIL_SIZE, THUMBNAIL_SIZE), interpolation=cv2.INTER_AREA)
+
+
+def frame_difference(a, b):
+    """Mean absolute difference between two thumbnails, 0.0 (identical) to 1.0"""
+    return float(np.mean(cv2.absdiff(a, b))) / 255.0
@@ -0,0 +1,82 @@
+"""
+Serving profile: tuned settings written by `python -m inference autotune`
+
+A profile is a JSON file whose "settings" map environment variable names
+to values, e.g. {"settings": {"BATCH_MAX_SIZE": "4", "MODEL_SERVER_WORKERS": "2"}}.
+inference.py and gunicorn.conf.py apply it at startup before reading their
+configuration. Variables already set in the environment win, so an
+endpoint can still override a single knob without editing the profile.
+
+SERVING_PROFILE names the file (default /opt/program/serving_profile.json);
+a missing file is not an error.
+"""
+
+import os
+import json
+
+DEFAULT_PROFILE_PATH = '/opt/program/serving_profile.json'
+
+# Environment variables a profile may set
+PROFILE_KEYS = (
+    'INFERENCE_BACKEND',
+    'INFERENCE_PRECISION',
+    'MODEL_SERVER_WORKERS',
+    'TORCH_THREADS_PER_WORKER',
+    'GUNICORN_THREADS',
+    'BATCH_MAX_SIZE',
+    'BATCH_MAX_WAIT_MS',
+    'MODEL_IMGSZ',
+    'IMGSZ_LADDER',
+)
+
+_applied = None
+
+
+def profile_path():
+    return os.environ.get('SERVING_PROFILE', DEFAULT_PROFILE_PATH)
+
+
+def load_profile(path):
+    """Read a profile file; returns its settings dict ({} if the file does not exist)"""
+    try:
+        with open(path) as f:
+            profile = json.load(f)
+    except FileNotFoundError:
+        return {}
+    settings = profile.get('settings', {})
+    unknown = sorted(set(settings) - set(PROFILE_KEYS))
+    if unknown:
+        raise ValueError(f"Unknown settings in serving profile {path}: {', '.join(unknown)}")
+    return {key: str(value) for key, value in settings.items()}
+
+
+def apply_profile():
+    """
+    Export the profile's settings into os.environ (once per process) and
+    return the ones applied. Explicitly set variables are left alone.
+    """
+    global _applied
+    if _applied is not None:
+        return _applied
+    path = profile_path()
+    _applied = {}
+    for key, value in load_profile(path).items():
+        if key not in os.environ:
+            os.environ[key] = value
+            _applied[key] = value
+    if _applied:
+        print(f"Applied serving profile {path}: "
+              + ", ".join(f"{k}={v}" for k, v in sorted(_applied.items())))
+    return _applied
+
+
+def write_profile(path, settings, measured=None, host=None):
+    """Write a profile file with its settings and the measurements that picked them"""
+    profile = {
+        "settings": {key: str(value) for key, value in settings.items()},
+        "measured": measured or {},
+        "host": host or {},
+    }
+    with open(path, 'w') as f:
+        json.dump(profile, f, indent=2, sort_keys=True)
+        f.write('\n')
@@ -0,0 +1,205 @@
+"""
+Lightweight multi-object tracking between detector keyframes
+
+In tracking mode the detector only runs on keyframes; frames in between get
+boxes propagated by a constant-velocity Kalman filter per object. Keyframe
+detections are associated with existing tracks ByteTrack-style: confident
+detections first, then low-confidence ones against the tracks still
+unmatched, so objects that briefly score low keep their track id.
+
+The keyframe interval adapts per session: it grows while the filter's
+predictions keep landing on the detections and shrinks (or a keyframe is
+forced) when they do not or the scene moves a lot.
+"""
+
+import threading
+
+import numpy as np
+
+from detections import Detections, box_iou
+
+# Kalman noise, relative to box height (ByteTrack's defaults)
+_STD_POSITION = 1.0 / 20
+_STD_VELOCITY = 1.0 / 160
+
+# Constant-velocity model over (cx, cy, w, h) and their per-frame velocities
+_F = np.eye(8)
+_F[:4, 4:] = np.eye(4)
+_H = np.eye(4, 8)
+
+
+def _to_cxcywh(xyxy):
+    x1, y1, x2, y2 = xyxy
+    return np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1], dtype=np.float64)
+
+
+class KalmanBox:
+    """Kalman filter for one box in (cx, cy, w, h) with velocities"""
+
+    __slots__ = ('mean', 'covariance')
+
+    def __init__(self, xyxy):
+        measurement = _to_cxcywh(xyxy)
+        h = max(measurement[3], 1.0)
+        self.mean = np.concatenate([measurement, np.zeros(4)])
+        std = np.array([2 * _STD_POSITION * h] * 4 + [10 * _STD_VELOCITY * h] * 4)
+        self.covariance = np.diag(np.square(std))
+
+    def predict(self):
+        h = max(self.mean[3], 1.0)
+        std = np.array([_STD_POSITION * h] * 4 + [_STD_VELOCITY * h] * 4)
+        self.mean = _F @ self.mean
+        self.covariance = _F @ self.covariance @ _F.T + np.diag(np.square(std))
+        # Boxes cannot shrink past zero however fast they were shrinking
+        self.mean[2:4] = np.maximum(self.mean[2:4], 1.0)
+
+    def update(self, xyxy):
+        h = max(self.mean[3], 1.0)
+        noise = np.diag(np.square([_STD_POSITION * h] * 4))
+        innovation_cov = _H @ self.covariance @ _H.T + noise
+        gain = self.covariance @ _H.T @ np.linalg.inv(innovation_cov)
+        self.mean = self.mean + gain @ (_to_cxcywh(xyxy) - _H @ self.mean)
+        self.covariance = (np.eye(8) - gain @ _H) @ self.covariance
+
+    @property
+    def xyxy(self):
+        cx, cy, w, h = self.mean[:4]
+        return np.array([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], dtype=np.float32)
+
+
+class Track:
+    __slots__ = ('track_id', 'class_id', 'score', 'box', 'kalman', 'active', 'frames_since_update')
+
+    def __init__(self, track_id, xyxy, class_id, score):
+        self.track_id = track_id
+        self.class_id = class_id
+        self.score = score
+        self.box = xyxy
+        self.kalman = KalmanBox(xyxy)
+        self.active = True
+        self.frames_since_update = 0
+
+
+def _associate(tracks, detections, indices, min_iou):
+    """Greedy same-class IoU matching: (matches, unmatched tracks, unmatched detection indices)"""
+    if not tracks or len(indices) == 0:
+        return [], list(tracks), list(indices)
+    iou = box_iou(np.stack([t.box for t in tracks]), detections.xyxy[indices])
+    same_class = np.array([t.class_id for t in tracks])[:, None] == detections.class_ids[indices][None, :]
+    iou = np.where(same_class, iou, 0.0)
+    pairs = np.argwhere(iou >= min_iou)
+    order = np.argsort(-iou[pairs[:, 0], pairs[:, 1]], kind='stable')
+    used_tracks, used_dets, matches = set(), set(), []
+    for t, d in pairs[order]:
+        if t in used_tracks or d in used_dets:
+            continue
+        used_tracks.add(t)
+        used_dets.add(d)
+        matches.append((tracks[t], int(indices[d]), float(iou[t, d])))
+    unmatched_tracks = [track for i, track in enumerate(tracks) if i not in used_tracks]
+    unmatched_dets = [int(indices[i]) for i in range(len(indices)) if i not in used_dets]
+    return matches, unmatched_tracks, unmatched_dets
+
+
+class Tracker:
+    """
+    Tracks for one session plus its adaptive keyframe cadence
+
+    update() takes keyframe detections (already in original image pixels,
+    ideally produced with a low conf so the second association pass has
+    candidates) and predict() advances every track by one frame. Both return
+    Detections with track_ids for the tracks currently visible.
+    """
+
+    def __init__(self, high_conf=0.25, match_iou=0.2, low_match_iou=0.5, max_age=30,
+                 min_interval=1, max_interval=5, stable_iou=0.7):
+        self.high_conf = high_conf
+        self.match_iou = match_iou
+        self.low_match_iou = low_match_iou
+        self.max_age = max_age
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.stable_iou = stable_iou
+        self.interval = min_interval
+        self.frames_since_keyframe = 0
+        self.tracks = []
+        self.lock = threading.Lock()
+        self._next_id = 1
+
+    def keyframe_due(self):
+        return self.frames_since_keyframe + 1 >= self.interval
+
+    def predict(self):
+        """Propagate tracks to the next (non-key) frame"""
+        self.frames_since_keyframe += 1
+        self._advance()
+        return self._output()
+
+    def update(self, detections):
+        """Associate keyframe detections with tracks and adapt the keyframe interval"""
+        self.frames_since_keyframe = 0
+        self._advance()
+
+        high = np.flatnonzero(detections.confidence >= self.high_conf)
+        low = np.flatnonzero(detections.confidence < self.high_conf)
+
+        matches, unmatched, new_dets = _associate(self.tracks, detections, high, self.match_iou)
+        # Low-confidence detections can only continue tracks that were visible
+        second, unmatched, _ = _associate([t for t in unmatched if t.active], detections, low, self.low_match_iou)
+        matches += second
+
+        expected = sum(1 for t in self.tracks if t.active)
+        for track, index, _ in matches:
+            track.box = detections.xyxy[index]
+            track.kalman.update(track.box)
+            track.score = float(detections.confidence[index])
+            track.active = True
+            track.frames_since_update = 0
+        for track in unmatched:
+            track.active = False
+        for index in new_dets:
+            self.tracks.append(Track(self._next_id, detections.xyxy[index],
+                                     int(detections.class_ids[index]), float(detections.confidence[index])))
+            self._next_id += 1
+
+        self._adapt(matches, expected, len(new_dets))
+        return self._output()
+
+    def _advance(self):
+        for track in self.tracks:
+            track.kalman.predict()
+            track.box = track.kalman.xyxy
+            track.frames_since_update += 1
+        self.tracks = [t for t in self.tracks if t.frames_since_update <= self.max_age]
+
+    def _adapt(self, matches, expected, new_tracks):
+        """Longer gaps while predictions keep hitting the detections, shorter otherwise"""
+        if expected == 0 and new_tracks == 0:
+            quality = 1.0
+        else:
+            # Tracks lost or born since the last keyframe count as misses
+            hits = sum(iou for _, _, iou in matches)
+            quality = hits / max(expected + new_tracks, 1)
+        if quality >= self.stable_iou:
+            self.interval = min(self.interval + 1, self.max_interval)
+        else:
+            self.interval = max(self.interval // 2, self.min_interval)
+
+    def force_keyframe(self):
+        self.interval = self.min_interval
+
+    def _output(self):
+        visible = [t for t in self.tracks if t.active]
+        if not visible:
+            return Detections(
+                xyxy=np.zeros((0, 4), dtype=np.float32),
+                class_ids=np.zeros(0, dtype=np.int64),
+                confidence=np.zeros(0, dtype=np.float32),
+                track_ids=np.zeros(0, dtype=np.int64),
+            )
+        return Detections(
+            xyxy=np.stack([t.box for t in visible]).astype(np.float32),
+            class_ids=np.array([t.class_id for t in visible], dtype=np.int64),
+            confidence=np.array([t.score for t in visible], dtype=np.float32),
+            track_ids=np.array([t.track_id for t in visible], dtype=np.int64),
+        )
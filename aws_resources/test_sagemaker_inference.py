@@ -6,23 +6,37 @@ One script that does everything:
   1. Finds all images in the given directory (any format/size)
   2. Resizes them to fit within the 32 KB WebSocket frame limit
   3. Sends each image to SageMaker via WebSocket for inference
-  4. Saves per-image detection results as JSON
-  5. Generates a summary report
+  4. Streams per-image detection results to test_results/results.jsonl
+  5. Generates a summary report, aggregated as results arrive
 
 Usage:
   python3 test_sagemaker_inference.py --ws-url wss://xxxxx.execute-api.us-east-1.amazonaws.com --images-dir path/to/images
 
+Load mode (--load) instead simulates concurrent walking users, each on its
+own connection streaming frames at --fps, and reports throughput, error and
+timeout rates and latency percentiles. --users takes a list to step the
+load up and find where latency degrades:
+  python3 test_sagemaker_inference.py --load --users 1,5,10,20 --fps 2 --duration 60
+
 API Gateway WebSocket has a 32 KB per-frame limit. The websocket-client library
 sends messages as a single frame, so the full JSON payload must be < 32 KB.
-Images are automatically resized to fit this constraint.
+Images are automatically resized to fit this constraint, in a process pool
+(--workers), and the fitted images are cached in .payload_cache/ so later
+runs over the same corpus skip the work (--no-cache to redo it).
 """
 
 import json
 import base64
+import hashlib
 import io
 import os
+import math
 import time
+import random
+import asyncio
 import argparse
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from websocket import create_connection
@@ -33,17 +47,35 @@ try:
 except ImportError:
     HAS_PIL = False
 
+try:
+    import websockets
+    HAS_WEBSOCKETS = True
+except ImportError:
+    HAS_WEBSOCKETS = False
+
 # ============================================================
 # Configuration
 # ============================================================
 SCRIPT_DIR = Path(__file__).parent.absolute()
 TEST_RESULTS_DIR = SCRIPT_DIR / "test_results"
+# One JSON line per tested image, rewritten each run
+RESULTS_FILE = TEST_RESULTS_DIR / "results.jsonl"
 
-# 32 KB frame limit minus JSON wrapper overhead, divided by base64 expansion (4/3)
-# 32,768 - 31 bytes wrapper = 32,737 bytes for base64 / 1.333 = ~24,500 bytes
-# Target 23 KB raw for comfortable margin
-MAX_RAW_IMAGE_BYTES = 23 * 1024  # 23 KB
+# The raw image budget is derived exactly from this (see max_raw_bytes)
 MAX_PAYLOAD_BYTES = 32 * 1024     # 32 KB frame limit
+# Payload sizes are checked with the longest frame id the load test sends
+MAX_FRAME_ID = 10 ** 9 - 1
+
+# Oversized images are re-encoded as JPEG: quality is lowered first (down to
+# MIN_JPEG_QUALITY), then the image is scaled down at that quality
+MAX_JPEG_QUALITY = 85
+MIN_JPEG_QUALITY = 40
+MIN_LONG_EDGE = 16
+
+# Fitted images are cached here, keyed by image content and the limits above
+PAYLOAD_CACHE_DIR = SCRIPT_DIR / ".payload_cache"
+# Bump when the fitting changes so old cache entries are not reused
+FITTER_VERSION = 2
 
 IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp',
                     '.JPG', '.JPEG', '.PNG', '.BMP', '.GIF', '.WEBP'}
@@ -62,84 +94,185 @@ def find_images(directory):
     return images
 
 
-def prepare_image(image_path):
-    """
-    Prepare an image for the WebSocket API.
-    If the full JSON payload would exceed 32 KB, resize the image.
-    Returns (base64_string, original_size_bytes, was_resized).
-    """
-    with open(image_path, "rb") as f:
-        raw_bytes = f.read()
-    original_size = len(raw_bytes)
-
-    # Check if it already fits within the frame limit
-    b64 = base64.b64encode(raw_bytes).decode('utf-8')
-    payload_size = len(json.dumps({"action": "frame", "body": b64}).encode('utf-8'))
+def base64_size(raw_size):
+    """Exact length of the base64 encoding of raw_size bytes"""
+    return 4 * ((raw_size + 2) // 3)
 
-    if payload_size <= MAX_PAYLOAD_BYTES:
-        return b64, original_size, False
 
-    # Needs resizing
-    if not HAS_PIL:
-        raise RuntimeError(
-            f"Image {image_path.name} is too large ({payload_size / 1024:.1f} KB payload) "
-            f"and Pillow is not installed for resizing. Install with: pip install Pillow"
-        )
+def max_raw_bytes(limit=MAX_PAYLOAD_BYTES):
+    """Largest raw image whose frame message (with the longest frame id) fits in limit bytes"""
+    # Base64 needs no JSON escaping, so the message is a fixed wrapper plus the base64 text
+    overhead = len(frame_message("", MAX_FRAME_ID).encode('utf-8'))
+    return (limit - overhead) // 4 * 3
 
-    img = Image.open(image_path)
 
-    # Convert to RGB if needed (PNG with alpha, palette mode, etc.)
+def _to_rgb(img):
+    """Flatten alpha onto white and convert palette/other modes to RGB"""
     if img.mode in ('RGBA', 'LA', 'P'):
         background = Image.new('RGB', img.size, (255, 255, 255))
         if img.mode == 'P':
             img = img.convert('RGBA')
         background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-        img = background
-    elif img.mode != 'RGB':
-        img = img.convert('RGB')
-
-    quality = 85
-    scale = 1.0
-
-    for _ in range(15):
-        if scale < 1.0:
-            new_size = (int(img.width * scale), int(img.height * scale))
-            resized = img.resize(new_size, Image.Resampling.LANCZOS)
+        return background
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+
+def _scaled_size(img, long_edge):
+    ratio = long_edge / max(img.size)
+    return max(1, round(img.width * ratio)), max(1, round(img.height * ratio))
+
+
+def _encode_jpeg(img, long_edge, quality):
+    if long_edge < max(img.size):
+        img = img.resize(_scaled_size(img, long_edge), Image.Resampling.LANCZOS, reducing_gap=3.0)
+    buf = io.BytesIO()
+    img.save(buf, 'JPEG', quality=quality, optimize=True)
+    return buf.getvalue()
+
+
+def _largest_fitting(lo, hi, encode, max_bytes):
+    """Binary search for the largest value in [lo, hi] whose encoding fits; (value, bytes) or None"""
+    best = None
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        data = encode(mid)
+        if len(data) <= max_bytes:
+            best = (mid, data)
+            lo = mid + 1
         else:
-            resized = img
-
-        buf = io.BytesIO()
-        resized.save(buf, 'JPEG', quality=quality, optimize=True)
-        jpeg_bytes = buf.getvalue()
+            hi = mid - 1
+    return best
 
-        b64 = base64.b64encode(jpeg_bytes).decode('utf-8')
-        payload_size = len(json.dumps({"action": "frame", "body": b64}).encode('utf-8'))
 
-        if payload_size <= MAX_PAYLOAD_BYTES:
-            return b64, original_size, True
-
-        # Shrink further
-        if payload_size > MAX_PAYLOAD_BYTES * 1.5:
-            scale *= 0.75
-        elif payload_size > MAX_PAYLOAD_BYTES * 1.1:
-            quality -= 10
+def fit_image(img, max_bytes):
+    """
+    JPEG bytes of an RGB image within max_bytes: the highest quality that
+    fits at full size, else the largest size that fits at MIN_JPEG_QUALITY.
+    Encoded size grows with both, so each ends in a binary search.
+    """
+    long_edge = max(img.size)
+    smallest = _encode_jpeg(img, long_edge, MIN_JPEG_QUALITY)
+    if len(smallest) <= max_bytes:
+        found = _largest_fitting(MIN_JPEG_QUALITY + 1, MAX_JPEG_QUALITY,
+                                 lambda quality: _encode_jpeg(img, long_edge, quality), max_bytes)
+        return found[1] if found else smallest
+
+    # Bracket the edge before searching: fit is an (edge, bytes) known to
+    # fit, fail an edge known not to. Scaling the area by the byte ratio is
+    # only a first guess, since bytes per pixel change with scale either way
+    # (noise compresses far better once shrunk), so probes step by their own
+    # byte ratio until an edge that fits sits below one checked not to.
+    fit, fail = None, long_edge
+    edge = max(MIN_LONG_EDGE, min(long_edge - 1, int(long_edge * math.sqrt(max_bytes / len(smallest)))))
+    while True:
+        scaled = img.resize(_scaled_size(img, edge), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        data = _encode_jpeg(scaled, edge, MIN_JPEG_QUALITY)
+        step = int(edge * max_bytes / len(data))
+        if len(data) <= max_bytes:
+            fit = (edge, data)
+            if fail - edge <= 1:
+                break
+            edge = min(fail - 1, max(edge + 1, step))
         else:
-            quality -= 5
+            fail = edge
+            # Every later probe is smaller, and resizing from this copy is cheaper
+            img = scaled
+            if fit is not None:
+                break
+            if edge <= MIN_LONG_EDGE:
+                raise ValueError(f"Cannot fit image within {max_bytes} bytes")
+            edge = max(MIN_LONG_EDGE, min(edge - 1, step))
+
+    if fail - fit[0] <= 1:
+        return fit[1]
+    # Search from a copy scaled down to the bracket, so trial resizes are cheap
+    img = img.resize(_scaled_size(img, fail - 1), Image.Resampling.LANCZOS, reducing_gap=3.0)
+    found = _largest_fitting(fit[0] + 1, fail - 1,
+                             lambda edge: _encode_jpeg(img, edge, MIN_JPEG_QUALITY), max_bytes)
+    return found[1] if found else fit[1]
+
+
+def prepare_image(image_path, use_cache=True):
+    """
+    Prepare an image for the WebSocket API.
+    If the full JSON payload would exceed 32 KB, re-encode it to fit
+    (see fit_image); fitted images are cached in PAYLOAD_CACHE_DIR.
+    Returns (base64_string, original_size_bytes, was_resized).
+    """
+    with open(image_path, "rb") as f:
+        raw_bytes = f.read()
+    original_size = len(raw_bytes)
+    max_bytes = max_raw_bytes()
 
-        if quality < 40:
-            quality = 40
-            scale *= 0.85
+    # Check if it already fits within the frame limit
+    if original_size <= max_bytes:
+        return base64.b64encode(raw_bytes).decode('utf-8'), original_size, False
+
+    limits = f"{max_bytes}:{MIN_JPEG_QUALITY}:{MAX_JPEG_QUALITY}:{MIN_LONG_EDGE}:{FITTER_VERSION}"
+    key = hashlib.sha256(raw_bytes + limits.encode('utf-8')).hexdigest()
+    cache_file = PAYLOAD_CACHE_DIR / f"{key}.jpg"
+    if use_cache and cache_file.is_file():
+        jpeg_bytes = cache_file.read_bytes()
+    else:
+        # Needs resizing
+        if not HAS_PIL:
+            raise RuntimeError(
+                f"Image {Path(image_path).name} is too large "
+                f"({base64_size(original_size) / 1024:.1f} KB base64) "
+                f"and Pillow is not installed for resizing. Install with: pip install Pillow"
+            )
+        jpeg_bytes = fit_image(_to_rgb(Image.open(io.BytesIO(raw_bytes))), max_bytes)
+        if use_cache:
+            PAYLOAD_CACHE_DIR.mkdir(exist_ok=True)
+            # Write then rename, so concurrent preparers never read a partial file
+            temp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+            temp_file.write_bytes(jpeg_bytes)
+            os.replace(temp_file, cache_file)
+
+    return base64.b64encode(jpeg_bytes).decode('utf-8'), original_size, True
+
+
+def _prepare_task(image_path, use_cache):
+    try:
+        return prepare_image(image_path, use_cache), None
+    except Exception as e:
+        return None, str(e)
 
-    # Best effort - return whatever we got
-    return b64, original_size, True
+
+def prepare_images(image_files, workers=None, use_cache=True, prefetch=64):
+    """
+    Yield (image_path, prepared, error) in input order, preparing images
+    ahead in a process pool; prepared is prepare_image()'s result, or None
+    with an error message. At most `prefetch` images are prepared ahead.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for image_path in image_files:
+            pending.append((image_path, executor.submit(_prepare_task, image_path, use_cache)))
+            if len(pending) >= prefetch:
+                image_path, future = pending.popleft()
+                yield (image_path, *future.result())
+        while pending:
+            image_path, future = pending.popleft()
+            yield (image_path, *future.result())
 
 
 # ============================================================
 # WebSocket / Inference
 # ============================================================
+def frame_message(base64_image, frame_id=None):
+    """JSON text of one `frame` action; the handler echoes frame_id back as frameId"""
+    message = {"action": "frame", "body": base64_image}
+    if frame_id is not None:
+        message["frameId"] = frame_id
+    return json.dumps(message)
+
+
 def send_image_for_inference(ws, image_name, base64_image):
     """Send image to WebSocket and receive inference results"""
-    payload = json.dumps({"action": "frame", "body": base64_image})
+    payload = frame_message(base64_image)
     payload_kb = len(payload.encode('utf-8')) / 1024
 
     start_time = time.time()
@@ -161,91 +294,133 @@ def send_image_for_inference(ws, image_name, base64_image):
         return None, total_time_ms, f"Invalid JSON response: {str(e)}"
 
 
-def save_result(image_name, result, total_time_ms, original_kb, resized, error=None):
-    """Save inference result to JSON file"""
-    base_name = Path(image_name).stem
-    output_file = TEST_RESULTS_DIR / f"{base_name}_detections.json"
+class ResultWriter:
+    """Appends one JSON line per image to RESULTS_FILE, flushed as it goes"""
 
-    output_data = {
-        "image": image_name,
-        "timestamp": datetime.now().isoformat(),
-        "total_latency_ms": total_time_ms,
-        "original_size_kb": round(original_kb, 1),
-        "was_resized": resized,
-    }
+    def __init__(self, path):
+        self._file = open(path, "w")
+
+    def write(self, image_name, result, total_time_ms, original_kb, resized, error=None):
+        output_data = {
+            "image": image_name,
+            "timestamp": datetime.now().isoformat(),
+            "total_latency_ms": total_time_ms,
+            "original_size_kb": round(original_kb, 1),
+            "was_resized": resized,
+        }
 
-    if error:
-        output_data["error"] = error
-        output_data["status"] = "failed"
-    elif result:
-        output_data.update(result)
+        if error:
+            output_data["error"] = error
+            output_data["status"] = "failed"
+        elif result:
+            output_data.update(result)
 
-    with open(output_file, "w") as f:
-        json.dump(output_data, f, indent=2)
+        # One line per image, so an interrupted run keeps everything before it
+        self._file.write(json.dumps(output_data) + "\n")
+        self._file.flush()
+        return output_data
 
-    return output_data
+    def close(self):
+        self._file.close()
 
 
 # ============================================================
 # Summary / Reporting
 # ============================================================
-def generate_summary(all_results):
-    """Generate summary report from all results"""
-    summary = {
-        "test_run_timestamp": datetime.now().isoformat(),
-        "total_images": len(all_results),
-        "successful": 0,
-        "failed": 0,
-        "total_detections": 0,
-        "average_total_latency_ms": 0,
-        "average_inference_time_ms": 0,
-        "average_detections_per_image": 0,
-        "classes_detected": set(),
-        "images": []
-    }
-
-    total_latency = 0
-    total_inference_time = 0
-    successful_count = 0
+class LatencyHistogram:
+    """
+    Log-bucketed latency histogram: each bucket is `precision` wide relative
+    to its value, so percentiles stay within that error at any latency
+    without keeping every sample
+    """
 
-    for result in all_results:
-        image_summary = {
-            "name": result["image"],
-            "status": result.get("status", "unknown"),
-            "total_latency_ms": result.get("total_latency_ms", 0),
-            "was_resized": result.get("was_resized", False),
-        }
+    def __init__(self, precision=0.01):
+        self._log_base = math.log1p(precision)
+        self.counts = Counter()
+        self.count = 0
+        self.max_ms = 0.0
+
+    def record(self, latency_ms):
+        self.counts[int(math.log(max(latency_ms, 1.0)) / self._log_base)] += 1
+        self.count += 1
+        self.max_ms = max(self.max_ms, latency_ms)
+
+    def percentile(self, p):
+        """Upper edge of the bucket holding the p-th percentile (0 when empty)"""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * p / 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(math.exp((index + 1) * self._log_base), self.max_ms)
+        return self.max_ms
+
+
+class SummaryAggregator:
+    """
+    Summary statistics updated one result at a time: running totals, class
+    counts and latency histograms, so memory stays constant however many
+    images a run covers
+    """
 
+    def __init__(self):
+        self.total = 0
+        self.successful = 0
+        self.failed = 0
+        self.total_detections = 0
+        self.total_latency = 0
+        self.total_inference_time = 0
+        self.latency = LatencyHistogram()
+        self.inference_time = LatencyHistogram()
+        self.classes = Counter()
+        self.errors = Counter()
+
+    def add(self, result):
+        self.total += 1
         if result.get("status") == "success":
-            summary["successful"] += 1
-            successful_count += 1
-
+            self.successful += 1
             detections = result.get("detections", [])
-            detection_count = len(detections)
-            summary["total_detections"] += detection_count
-
-            image_summary["detections"] = detection_count
-            image_summary["inference_time_ms"] = result.get("metadata", {}).get("inferenceTimeMs", 0)
-
-            total_latency += result.get("total_latency_ms", 0)
-            total_inference_time += result.get("metadata", {}).get("inferenceTimeMs", 0)
-
-            classes_found = [d["className"] for d in detections]
-            image_summary["classes_found"] = classes_found
-            summary["classes_detected"].update(classes_found)
+            self.total_detections += len(detections)
+            self.classes.update(d["className"] for d in detections)
+
+            latency = result.get("total_latency_ms", 0)
+            inference_time = result.get("metadata", {}).get("inferenceTimeMs", 0)
+            self.total_latency += latency
+            self.total_inference_time += inference_time
+            self.latency.record(latency)
+            self.inference_time.record(inference_time)
         else:
-            summary["failed"] += 1
-            image_summary["error"] = result.get("error", "Unknown error")
-
-        summary["images"].append(image_summary)
-
-    if successful_count > 0:
-        summary["average_total_latency_ms"] = int(total_latency / successful_count)
-        summary["average_inference_time_ms"] = int(total_inference_time / successful_count)
-        summary["average_detections_per_image"] = round(summary["total_detections"] / successful_count, 2)
-
-    summary["classes_detected"] = sorted(list(summary["classes_detected"]))
-    return summary
+            self.failed += 1
+            self.errors[str(result.get("error", "Unknown error"))[:80]] += 1
+
+    def summary(self):
+        """Summary report of every result added so far"""
+        def percentiles(histogram):
+            return {
+                "p50": round(histogram.percentile(50), 1),
+                "p90": round(histogram.percentile(90), 1),
+                "p99": round(histogram.percentile(99), 1),
+                "max": round(histogram.max_ms, 1),
+            }
+
+        count = self.successful
+        return {
+            "test_run_timestamp": datetime.now().isoformat(),
+            "total_images": self.total,
+            "successful": self.successful,
+            "failed": self.failed,
+            "total_detections": self.total_detections,
+            "average_total_latency_ms": int(self.total_latency / count) if count else 0,
+            "average_inference_time_ms": int(self.total_inference_time / count) if count else 0,
+            "average_detections_per_image": round(self.total_detections / count, 2) if count else 0,
+            "total_latency_percentiles_ms": percentiles(self.latency),
+            "inference_time_percentiles_ms": percentiles(self.inference_time),
+            "classes_detected": sorted(self.classes),
+            "class_counts": dict(self.classes.most_common()),
+            "errors": dict(self.errors.most_common(10)),
+        }
 
 
 def print_summary(summary):
@@ -260,22 +435,206 @@ def print_summary(summary):
     print(f"Avg Total Latency:    {summary['average_total_latency_ms']}ms")
     print(f"Avg Inference Time:   {summary['average_inference_time_ms']}ms")
     print(f"Avg Detections/Image: {summary['average_detections_per_image']}")
-    print(f"Classes Detected:     {', '.join(summary['classes_detected']) or 'none'}")
+    latency = summary["total_latency_percentiles_ms"]
+    print(f"Latency p50/p90/p99:  {latency['p50']:.0f} / {latency['p90']:.0f} / {latency['p99']:.0f}ms "
+          f"(max {latency['max']:.0f}ms)")
+    top_classes = list(summary['class_counts'].items())[:10]
+    print(f"Classes Detected:     {', '.join(f'{name} ({count})' for name, count in top_classes) or 'none'}")
+    if summary['errors']:
+        print("Errors:")
+        for message, count in summary['errors'].items():
+            print(f"  {count} x {message}")
     print("=" * 60)
 
-    print("\nIndividual Results:")
-    for img in summary['images']:
-        status = "OK" if img['status'] == 'success' else "FAIL"
-        resized_tag = " (resized)" if img.get("was_resized") else ""
-        print(f"\n  [{status}] {img['name']}{resized_tag}")
-        print(f"        Latency: {img['total_latency_ms']}ms")
-        if img['status'] == 'success':
-            print(f"        Detections: {img['detections']}")
-            print(f"        Inference: {img['inference_time_ms']}ms")
-            if img.get('classes_found'):
-                print(f"        Classes: {', '.join(img['classes_found'])}")
-        else:
-            print(f"        Error: {img.get('error', 'Unknown')}")
+
+# ============================================================
+# Load Test
+# ============================================================
+class LoadStats:
+    """Counters shared by every simulated user in one load step"""
+
+    def __init__(self):
+        self.sent = 0
+        self.skipped = 0
+        self.ok = 0
+        self.timeouts = 0
+        self.connect_failures = 0
+        self.errors = Counter()
+        self.latency = LatencyHistogram()
+        self.last_response = 0.0
+
+    def error(self, message):
+        self.errors[message[:80]] += 1
+
+
+def _parse_response(message):
+    """(response dict or None, None for a usable detection response or a short error description)"""
+    if not message:
+        return None, "Empty response (likely exceeded 32 KB frame limit)"
+    try:
+        response = json.loads(message)
+    except json.JSONDecodeError:
+        return None, "Invalid JSON response"
+    if response.get("status") == "error" or "error" in response:
+        return response, response.get("error") or "Unknown error"
+    if response.get("valid") is False:
+        return response, "Frame rejected as invalid"
+    return response, None
+
+
+async def simulate_user(user, ws_url, payloads, args, stats, start, stop):
+    """
+    One walking user: open-loop frames at args.fps on its own connection
+    Frames are sent on schedule whether or not earlier responses are back,
+    so a slow endpoint shows up as latency and timeouts rather than as a
+    lower send rate. With args.window, at most that many frames are in
+    flight and frames due while the window is full are skipped, as the app
+    drops camera frames; the achieved fps then shows what the link carries.
+    Responses are matched to frames by their echoed frameId (in send order
+    if the backend does not echo it); frames unanswered after args.timeout
+    count as timeouts.
+    """
+    loop = asyncio.get_running_loop()
+    rng = random.Random(args.seed * 100003 + user)
+    try:
+        ws = await websockets.connect(ws_url, max_size=None, open_timeout=args.timeout)
+    except Exception as e:
+        stats.connect_failures += 1
+        stats.error(f"Connect failed: {e}")
+        return
+
+    # frame id -> send time, oldest first
+    pending = {}
+
+    def expire(now):
+        for frame_id, sent_at in list(pending.items()):
+            if now - sent_at <= args.timeout:
+                break
+            del pending[frame_id]
+            stats.timeouts += 1
+
+    async def receive():
+        async for message in ws:
+            now = loop.time()
+            expire(now)
+            response, error = _parse_response(message)
+            frame_id = response.get("frameId") if response else None
+            if frame_id in pending:
+                sent_at = pending.pop(frame_id)
+            elif frame_id is None and pending:
+                sent_at = pending.pop(next(iter(pending)))
+            else:
+                # Late answer to a frame already counted as timed out
+                continue
+            if error:
+                stats.error(error)
+            else:
+                stats.ok += 1
+                stats.latency.record((now - sent_at) * 1000)
+            stats.last_response = now
+
+    receiver = asyncio.create_task(receive())
+    interval = 1.0 / args.fps
+    # Spread first frames over one interval so users do not send in lockstep
+    next_send = start + rng.uniform(0, interval)
+    frame_id = 0
+    try:
+        while next_send < stop and not receiver.done():
+            await asyncio.sleep(max(0.0, next_send - loop.time()))
+            next_send += rng.expovariate(args.fps) if args.arrivals == 'poisson' else interval
+            expire(loop.time())
+            if args.window and len(pending) >= args.window:
+                stats.skipped += 1
+                continue
+            frame_id += 1
+            pending[frame_id] = loop.time()
+            await ws.send(frame_message(payloads[(user + frame_id) % len(payloads)], frame_id))
+            stats.sent += 1
+
+        # Give the last frames up to args.timeout to come back
+        deadline = loop.time() + args.timeout
+        while pending and not receiver.done() and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+    except Exception as e:
+        stats.error(f"Connection error: {e}")
+    finally:
+        receiver.cancel()
+        await ws.close()
+        stats.timeouts += len(pending)
+
+
+async def run_load_step(ws_url, payloads, users, args):
+    """Run `users` concurrent users for args.duration seconds; returns the step's report"""
+    stats = LoadStats()
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    stop = start + args.duration
+    await asyncio.gather(*(simulate_user(user, ws_url, payloads, args, stats, start, stop)
+                           for user in range(users)))
+    elapsed = max(stop, stats.last_response) - start
+    return {
+        "users": users,
+        "target_fps_per_user": args.fps,
+        "arrivals": args.arrivals,
+        "window": args.window,
+        "duration_s": round(elapsed, 1),
+        "sent": stats.sent,
+        "skipped": stats.skipped,
+        "successful": stats.ok,
+        "throughput_fps": round(stats.ok / elapsed, 2),
+        "error_rate": round(sum(stats.errors.values()) / max(stats.sent, 1), 4),
+        "timeout_rate": round(stats.timeouts / max(stats.sent, 1), 4),
+        "connect_failures": stats.connect_failures,
+        "latency_ms": {
+            "p50": round(stats.latency.percentile(50), 1),
+            "p90": round(stats.latency.percentile(90), 1),
+            "p99": round(stats.latency.percentile(99), 1),
+            "max": round(stats.latency.max_ms, 1),
+        },
+        "errors": dict(stats.errors.most_common(10)),
+    }
+
+
+def run_load_test(ws_url, image_files, args):
+    """Step through the --users levels and save the reports to load_summary.json"""
+    if not HAS_WEBSOCKETS:
+        print("Error: load mode needs the websockets package. Install with: pip install websockets")
+        return 1
+
+    payloads = []
+    for image_path, prepared, error in prepare_images(image_files, args.workers, not args.no_cache):
+        if error:
+            print(f"  Skipping {image_path.name}: {error}")
+            continue
+        payloads.append(prepared[0])
+    if not payloads:
+        print("Error: No usable images for the load test")
+        return 1
+
+    user_levels = [int(u) for u in args.users.split(',') if u.strip()]
+    window = f"{args.window} in flight" if args.window else "unlimited in flight"
+    print(f"\nLoad test: {len(payloads)} frames, {args.fps} fps/user ({args.arrivals} arrivals, {window}), "
+          f"{args.duration:.0f}s per step, {args.timeout:.0f}s timeout")
+    print(f"{'users':>6} {'sent':>6} {'skipped':>7} {'ok fps':>7} {'errors':>7} {'timeouts':>8} "
+          f"{'p50':>7} {'p90':>7} {'p99':>7} {'max':>7}")
+
+    steps = []
+    for users in user_levels:
+        report = asyncio.run(run_load_step(ws_url, payloads, users, args))
+        steps.append(report)
+        latency = report["latency_ms"]
+        print(f"{users:>6} {report['sent']:>6} {report['skipped']:>7} {report['throughput_fps']:>7.2f} "
+              f"{report['error_rate']:>7.1%} {report['timeout_rate']:>8.1%} "
+              f"{latency['p50']:>7.0f} {latency['p90']:>7.0f} {latency['p99']:>7.0f} {latency['max']:>7.0f}")
+        for message, count in report["errors"].items():
+            print(f"         {count} x {message}")
+
+    TEST_RESULTS_DIR.mkdir(exist_ok=True)
+    summary_file = TEST_RESULTS_DIR / "load_summary.json"
+    with open(summary_file, "w") as f:
+        json.dump({"test_run_timestamp": datetime.now().isoformat(), "ws_url": ws_url, "steps": steps}, f, indent=2)
+    print(f"\nLoad results: {summary_file}")
+    return 0
 
 
 # ============================================================
@@ -291,6 +650,30 @@ def main():
     parser.add_argument('--images-dir', type=str,
                         default='backend/tests/integration',
                         help='Directory containing test images (default: backend/tests/integration)')
+    parser.add_argument('--delay', type=float, default=0.5,
+                        help='Seconds between images in the one-by-one test (default: 0.5)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Processes preparing images (default: one per CPU)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help=f'Re-fit oversized images instead of reusing {PAYLOAD_CACHE_DIR.name}/')
+    load = parser.add_argument_group('load mode')
+    load.add_argument('--load', action='store_true',
+                      help='Simulate concurrent users instead of testing images one by one')
+    load.add_argument('--users', type=str, default='1',
+                      help='Concurrent users; a comma-separated list runs one step per level (default: 1)')
+    load.add_argument('--fps', type=float, default=2.0,
+                      help='Frames per second each user sends (default: 2)')
+    load.add_argument('--window', type=int, default=0,
+                      help='Frames in flight per connection; frames due while it is full are skipped '
+                           '(default: 0, unlimited)')
+    load.add_argument('--arrivals', choices=['poisson', 'fixed'], default='poisson',
+                      help='Frame arrival process per user (default: poisson)')
+    load.add_argument('--duration', type=float, default=30.0,
+                      help='Seconds of load per step (default: 30)')
+    load.add_argument('--timeout', type=float, default=10.0,
+                      help='Seconds before an unanswered frame counts as a timeout (default: 10)')
+    load.add_argument('--seed', type=int, default=0,
+                      help='Random seed for arrival times (default: 0)')
     args = parser.parse_args()
 
     # WebSocket URL
@@ -313,6 +696,9 @@ def main():
         print(f"Error: No images found in {images_dir}")
         return 1
 
+    if args.load:
+        return run_load_test(ws_url, image_files, args)
+
     # Print header
     print("=" * 60)
     print("YOLOv11 SageMaker Inference Test")
@@ -338,18 +724,23 @@ def main():
         print(f"Failed to connect: {str(e)}")
         return 1
 
-    all_results = []
+    writer = ResultWriter(RESULTS_FILE)
+    aggregator = SummaryAggregator()
+
+    # Images are prepared (resized if needed) ahead in a process pool
+    prepared_images = prepare_images(image_files, args.workers, not args.no_cache)
 
     try:
-        for i, image_path in enumerate(image_files, 1):
+        for i, (image_path, prepared, prepare_error) in enumerate(prepared_images, 1):
             image_name = image_path.name
             print(f"\n[{i}/{len(image_files)}] {image_name}")
 
-            # Prepare image (resize if needed)
             try:
-                base64_image, original_size, was_resized = prepare_image(image_path)
+                if prepare_error:
+                    raise RuntimeError(prepare_error)
+                base64_image, original_size, was_resized = prepared
                 original_kb = original_size / 1024
-                payload_kb = len(json.dumps({"action": "frame", "body": base64_image}).encode('utf-8')) / 1024
+                payload_kb = len(frame_message(base64_image).encode('utf-8')) / 1024
 
                 if was_resized:
                     print(f"  Resized: {original_kb:.1f} KB -> payload {payload_kb:.1f} KB")
@@ -358,8 +749,7 @@ def main():
 
             except Exception as e:
                 print(f"  Failed to prepare image: {str(e)}")
-                result_data = save_result(image_name, None, 0, 0, False, error=str(e))
-                all_results.append(result_data)
+                aggregator.add(writer.write(image_name, None, 0, 0, False, error=str(e)))
                 continue
 
             # Send for inference
@@ -368,34 +758,36 @@ def main():
 
                 if error:
                     print(f"  FAIL: {error}")
-                    result_data = save_result(image_name, result, total_time_ms, original_kb, was_resized, error)
+                    result_data = writer.write(image_name, result, total_time_ms, original_kb, was_resized, error)
                 elif result and result.get("status") == "success":
                     detection_count = len(result.get("detections", []))
                     inference_time = result.get("metadata", {}).get("inferenceTimeMs", 0)
                     print(f"  OK: {detection_count} detections in {total_time_ms}ms (inference: {inference_time}ms)")
-                    result_data = save_result(image_name, result, total_time_ms, original_kb, was_resized)
+                    result_data = writer.write(image_name, result, total_time_ms, original_kb, was_resized)
                 else:
                     error_msg = result.get("error", "Unknown error") if result else "No response"
                     print(f"  FAIL: {error_msg}")
-                    result_data = save_result(image_name, result, total_time_ms, original_kb, was_resized, error_msg)
+                    result_data = writer.write(image_name, result, total_time_ms, original_kb, was_resized, error_msg)
 
-                all_results.append(result_data)
+                aggregator.add(result_data)
 
             except Exception as e:
                 print(f"  Exception: {str(e)}")
-                result_data = save_result(image_name, None, 0, original_kb, was_resized, error=str(e))
-                all_results.append(result_data)
+                result_data = writer.write(image_name, None, 0, original_kb, was_resized, error=str(e))
+                aggregator.add(result_data)
 
             # Small delay between requests
             if i < len(image_files):
-                time.sleep(0.5)
+                time.sleep(args.delay)
 
     finally:
+        prepared_images.close()
+        writer.close()
         ws.close()
         print("\nConnection closed")
 
     # Summary
-    summary = generate_summary(all_results)
+    summary = aggregator.summary()
 
     summary_file = TEST_RESULTS_DIR / "summary.json"
     with open(summary_file, "w") as f:
@@ -407,7 +799,7 @@ def main():
     print("TEST COMPLETE")
     print("=" * 60)
     print(f"Results: {TEST_RESULTS_DIR}")
-    print(f"  {len(image_files)} detection files + summary.json")
+    print(f"  {RESULTS_FILE.name} ({summary['total_images']} results) + summary.json")
     print("=" * 60)
 
     return 0
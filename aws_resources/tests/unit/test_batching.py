@@ -0,0 +1,116 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "sagemaker"))
+
+from batching import (  # noqa: E402
+    DeadlineExceeded,
+    Expired,
+    MicroBatcher,
+    QueueFull,
+    Superseded,
+)
+
+
+class StubModel:
+    """Records each batch and holds the batching thread until released"""
+
+    def __init__(self, hold=True, delay=0.0):
+        self.calls = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        if not hold:
+            self.release.set()
+        self.delay = delay
+
+    def __call__(self, items):
+        self.calls.append(list(items))
+        self.started.set()
+        self.release.wait(timeout=5)
+        time.sleep(self.delay)
+        return [item.upper() for item in items]
+
+
+def busy_batcher(model, **kwargs):
+    """A batcher whose thread is already stuck running a first batch"""
+    batcher = MicroBatcher(model, max_batch_size=1, max_wait_ms=0, **kwargs)
+    first = batcher.submit_async("first")
+    assert model.started.wait(timeout=5)
+    return batcher, first
+
+
+def test_batches_items_and_returns_outputs():
+    model = StubModel(hold=False)
+    batcher = MicroBatcher(model, max_batch_size=4, max_wait_ms=50)
+    futures = [batcher.submit_async(item) for item in ("a", "b", "c")]
+    assert [f.result(timeout=5) for f in futures] == ["A", "B", "C"]
+    assert sum(len(call) for call in model.calls) == 3
+
+
+def test_newer_frame_with_same_key_supersedes_queued_one():
+    model = StubModel()
+    batcher, first = busy_batcher(model)
+    try:
+        old = batcher.submit_async("old", key="session")
+        new = batcher.submit_async("new", key="session")
+        other = batcher.submit_async("other", key="another")
+        assert isinstance(old.exception(timeout=5), Superseded)
+        assert batcher.pending == 2
+    finally:
+        model.release.set()
+    assert first.result(timeout=5) == "FIRST"
+    assert new.result(timeout=5) == "NEW"
+    assert other.result(timeout=5) == "OTHER"
+    assert ["old"] not in model.calls
+
+
+def test_item_past_deadline_while_queued_expires():
+    model = StubModel()
+    batcher, first = busy_batcher(model)
+    try:
+        # No batch has finished yet, so the predicted wait is zero and it is admitted
+        late = batcher.submit_async("late", deadline=time.monotonic() + 0.05)
+        time.sleep(0.1)
+    finally:
+        model.release.set()
+    assert first.result(timeout=5) == "FIRST"
+    error = late.exception(timeout=5)
+    assert isinstance(error, Expired)
+    assert error.reason == "expired"
+    assert ["late"] not in model.calls
+
+
+def test_admission_rejects_when_queue_is_full():
+    model = StubModel()
+    batcher, first = busy_batcher(model, max_queue_size=2)
+    try:
+        keyed = batcher.submit_async("a", key="session")
+        plain = batcher.submit_async("b")
+        with pytest.raises(QueueFull) as raised:
+            batcher.submit_async("c")
+        assert raised.value.reason == "queue_full"
+        # Replacing a queued frame from the same session does not need a free slot
+        newer = batcher.submit_async("a2", key="session")
+        assert isinstance(keyed.exception(timeout=5), Superseded)
+    finally:
+        model.release.set()
+    assert first.result(timeout=5) == "FIRST"
+    assert plain.result(timeout=5) == "B"
+    assert newer.result(timeout=5) == "A2"
+
+
+def test_admission_rejects_when_predicted_wait_exceeds_deadline():
+    model = StubModel(hold=False, delay=0.05)
+    batcher = MicroBatcher(model, max_batch_size=1, max_wait_ms=0)
+    batcher.submit("warm", timeout=5)
+    assert batcher.estimated_wait() >= 0.05
+
+    with pytest.raises(DeadlineExceeded) as raised:
+        batcher.submit_async("hurry", deadline=time.monotonic() + 0.01)
+    assert raised.value.reason == "deadline"
+    assert raised.value.retry_after >= 0.05
+    assert batcher.submit("relaxed", timeout=5, deadline=time.monotonic() + 5) == "RELAXED"
@@ -0,0 +1,15 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "sagemaker"))
+
+import benchmark  # noqa: E402
+import test_sagemaker_inference  # noqa: E402
+
+
+def test_frame_budget_matches_test_client():
+    # benchmark.py ships in the image without the test client, so it keeps its own copy
+    assert benchmark.frame_raw_budget() == test_sagemaker_inference.max_raw_bytes()
+    for limit in (8 * 1024, 32 * 1024, 128 * 1024):
+        assert benchmark.frame_raw_budget(limit) == test_sagemaker_inference.max_raw_bytes(limit)
@@ -0,0 +1,132 @@
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "sagemaker"))
+
+from decode import STRIDE, LetterboxedFrame, decode_image, letterbox, scale_to_original, wrap_raw_rgb  # noqa: E402
+from detections import Detections  # noqa: E402
+
+
+def frame(width=1280, height=720, scale=0.5, pad_x=0, pad_y=12):
+    return LetterboxedFrame(
+        image=np.zeros((384, 640, 3), dtype=np.uint8),
+        width=width, height=height,
+        scale_x=scale, scale_y=scale,
+        pad_x=pad_x, pad_y=pad_y,
+    )
+
+
+@pytest.mark.parametrize("count", [2, 5])
+def test_scale_to_original_keeps_every_field(count):
+    boxes = np.array([[10 * i, 12 + 10 * i, 10 * i + 40, 52 + 10 * i] for i in range(count)], dtype=np.float32)
+    detections = Detections(
+        xyxy=boxes,
+        class_ids=np.arange(count, dtype=np.int64),
+        confidence=np.linspace(0.9, 0.5, count).astype(np.float32),
+        track_ids=np.arange(100, 100 + count, dtype=np.int64),
+    )
+    scaled = scale_to_original(detections, frame())
+
+    assert len(scaled) == count
+    np.testing.assert_allclose(scaled.xyxy, (boxes - [0, 12, 0, 12]) / 0.5)
+    np.testing.assert_array_equal(scaled.class_ids, detections.class_ids)
+    np.testing.assert_array_equal(scaled.confidence, detections.confidence)
+    np.testing.assert_array_equal(scaled.track_ids, detections.track_ids)
+
+
+def test_scale_to_original_without_track_ids():
+    detections = Detections(
+        xyxy=np.array([[0, 12, 40, 52], [600, 300, 640, 372]], dtype=np.float32),
+        class_ids=np.array([0, 2], dtype=np.int64),
+        confidence=np.array([0.9, 0.8], dtype=np.float32),
+    )
+    scaled = scale_to_original(detections, frame())
+    assert scaled.track_ids is None
+    # Boxes reaching into the padding are clipped to the original image
+    np.testing.assert_allclose(scaled.xyxy[1], [1200, 576, 1280, 720])
+
+
+def encoded_scene(width, height, box, ext=".jpg"):
+    """A black image with one white rectangle at box (original pixels), encoded"""
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    x1, y1, x2, y2 = box
+    image[y1:y2, x1:x2] = 255
+    ok, data = cv2.imencode(ext, image)
+    assert ok
+    return data.tobytes()
+
+
+def bright_box(image):
+    """Bounding box of the bright pixels, in the image's own coordinates"""
+    ys, xs = np.nonzero(image[:, :, 1] > 127)
+    return np.array([xs.min(), ys.min(), xs.max() + 1, ys.max() + 1], dtype=np.float32)
+
+
+@pytest.mark.parametrize("width, height, box, factor", [
+    (3840, 2160, (1000, 500, 2200, 1700), 4),   # landscape, IMREAD_REDUCED_COLOR_4
+    (1080, 1920, (200, 300, 700, 1500), 2),     # portrait, IMREAD_REDUCED_COLOR_2
+    (1920, 1080, (64, 96, 640, 1000), 2),
+    (1000, 700, (100, 200, 900, 600), 1),       # too small to reduce
+])
+def test_jpeg_boxes_map_back_to_original_pixels(width, height, box, factor):
+    imgsz = 640
+    bgr, original_size = decode_image(encoded_scene(width, height, box), imgsz)
+    assert original_size == (width, height)
+    assert max(bgr.shape[:2]) == -(-max(width, height) // factor)
+
+    frame = letterbox(bgr, original_size, imgsz)
+    out_h, out_w = frame.image.shape[:2]
+    assert max(out_h, out_w) == imgsz
+    assert out_h % STRIDE == 0 and out_w % STRIDE == 0
+
+    # The rectangle as the model would report it, in letterboxed pixels
+    found = bright_box(frame.image)
+    detections = Detections(
+        xyxy=found[None, :],
+        class_ids=np.array([0], dtype=np.int64),
+        confidence=np.array([0.9], dtype=np.float32),
+    )
+    scaled = scale_to_original(detections, frame)
+    # One letterboxed pixel of resampling blur, in original pixels
+    tolerance = 1.5 / frame.scale_x
+    np.testing.assert_allclose(scaled.xyxy[0], box, atol=tolerance)
+
+
+def test_png_is_decoded_at_full_size():
+    box = (300, 100, 1200, 800)
+    bgr, original_size = decode_image(encoded_scene(2400, 1000, box, ext=".png"), 640)
+    assert bgr.shape[:2] == (1000, 2400)
+
+    frame = letterbox(bgr, original_size, 640)
+    assert frame.image.shape[:2] == (288, 640)
+    assert frame.pad_y > 0
+    detections = Detections(
+        xyxy=bright_box(frame.image)[None, :],
+        class_ids=np.array([0], dtype=np.int64),
+        confidence=np.array([0.9], dtype=np.float32),
+    )
+    np.testing.assert_allclose(scale_to_original(detections, frame).xyxy[0], box, atol=1.5 / frame.scale_x)
+
+
+def test_raw_rgb_frame_maps_back_with_padding():
+    width, height, box = 720, 1280, (100, 640, 400, 1100)
+    rgb = np.zeros((height, width, 3), dtype=np.uint8)
+    rgb[box[1]:box[3], box[0]:box[2]] = (255, 255, 255)
+    # Rows padded to a 64-byte stride, as camera buffers often are
+    stride = -(-width * 3 // 64) * 64
+    data = np.zeros((height, stride), dtype=np.uint8)
+    data[:, :width * 3] = rgb.reshape(height, -1)
+
+    frame = letterbox(wrap_raw_rgb(data.tobytes(), width, height, stride), (width, height), 640, rgb=True)
+    assert frame.image.shape[:2] == (640, 384)
+    assert frame.pad_x == 12
+    detections = Detections(
+        xyxy=bright_box(frame.image)[None, :],
+        class_ids=np.array([0], dtype=np.int64),
+        confidence=np.array([0.9], dtype=np.float32),
+    )
+    np.testing.assert_allclose(scale_to_original(detections, frame).xyxy[0], box, atol=1.5 / frame.scale_x)
@@ -0,0 +1,104 @@
+import json
+import os
+import sys
+
+import msgpack
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "sagemaker"))
+
+from detections import Detections, build_class_names  # noqa: E402
+from encoding import JSON, MSGPACK, encode, negotiate  # noqa: E402
+
+CLASS_NAMES = build_class_names({0: "person", 1: "bicycle", 2: "car", 56: "chair"})
+BODY = {"success": True, "image": {"width": 1280, "height": 720}, "imgsz": 640}
+
+
+def detections(track_ids=None):
+    return Detections(
+        xyxy=np.array([[10.7, 20.2, 110.9, 220.5], [300, 40, 420, 90], [5, 5, 50, 60]], dtype=np.float32),
+        class_ids=np.array([56, 0, 56], dtype=np.int64),
+        confidence=np.array([0.91, 0.5, 0.33], dtype=np.float32),
+        track_ids=track_ids,
+    )
+
+
+def empty():
+    return Detections(
+        xyxy=np.zeros((0, 4), dtype=np.float32),
+        class_ids=np.zeros(0, dtype=np.int64),
+        confidence=np.zeros(0, dtype=np.float32),
+    )
+
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, JSON),
+    ("", JSON),
+    ("*/*", JSON),
+    ("application/json", JSON),
+    ("application/x-msgpack", MSGPACK),
+    ("application/msgpack", MSGPACK),
+    ("Application/VND.MSGPACK", MSGPACK),
+    ("text/html, application/x-msgpack;q=0.9", MSGPACK),
+    ("application/json;q=0.5, application/x-msgpack", MSGPACK),
+    ("application/x-msgpack;q=0.5, application/json", JSON),
+    ("application/x-msgpack, application/json", MSGPACK),
+    ("application/json, application/x-msgpack", JSON),
+    ("application/x-msgpack;q=0", JSON),
+    ("application/x-msgpack;q=abc", JSON),
+    ("application/xml", JSON),
+    ("image/png;q=1, text/plain", JSON),
+])
+def test_negotiate(accept, expected):
+    assert negotiate(accept) == expected
+
+
+def test_json_fallback_uses_ultralytics_predictions():
+    body = json.loads(encode(dict(BODY), detections(), CLASS_NAMES, negotiate("application/xml")))
+    assert list(body) == ["success", "predictions", "image", "imgsz"]
+    assert body["predictions"][0] == {
+        "class": "chair",
+        "confidence": pytest.approx(0.91),
+        "box": {"x1": 10, "y1": 20, "x2": 110, "y2": 220},
+    }
+    assert [p["class"] for p in body["predictions"]] == ["chair", "person", "chair"]
+    assert all("track_id" not in p for p in body["predictions"])
+
+
+def test_json_error_body_has_no_predictions():
+    body = json.loads(encode({"success": False, "error": "bad"}, None, CLASS_NAMES))
+    assert body == {"success": False, "error": "bad"}
+
+
+def test_msgpack_round_trip():
+    source = detections(track_ids=np.array([7, 8, 9], dtype=np.int64))
+    body = msgpack.unpackb(encode(dict(BODY), source, CLASS_NAMES, MSGPACK), raw=False)
+
+    assert body["success"] is True
+    assert body["format"] == "packed-v1"
+    assert body["count"] == 3
+    assert body["image"] == BODY["image"]
+    assert body["imgsz"] == 640
+    assert body["classes"] == ["chair", "person"]
+    class_index = np.frombuffer(body["class_index"], np.uint8)
+    assert [body["classes"][i] for i in class_index] == ["chair", "person", "chair"]
+    np.testing.assert_array_equal(np.frombuffer(body["confidence"], "<f4"), source.confidence)
+    np.testing.assert_array_equal(np.frombuffer(body["boxes"], "<i4").reshape(-1, 4),
+                                  [[10, 20, 110, 220], [300, 40, 420, 90], [5, 5, 50, 60]])
+    np.testing.assert_array_equal(np.frombuffer(body["track_ids"], "<i4"), [7, 8, 9])
+
+
+def test_msgpack_round_trip_empty():
+    body = msgpack.unpackb(encode(dict(BODY), empty(), CLASS_NAMES, MSGPACK), raw=False)
+    assert body["count"] == 0
+    assert body["classes"] == []
+    for key in ("class_index", "confidence", "boxes"):
+        assert body[key] == b""
+    assert "track_ids" not in body
+    assert np.frombuffer(body["boxes"], "<i4").reshape(-1, 4).shape == (0, 4)
+
+
+def test_msgpack_error_body_is_not_packed():
+    body = msgpack.unpackb(encode({"success": False, "error": "bad"}, None, CLASS_NAMES, MSGPACK), raw=False)
+    assert body == {"success": False, "error": "bad"}
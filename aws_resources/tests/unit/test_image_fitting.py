@@ -0,0 +1,121 @@
+import base64
+import io
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+import test_sagemaker_inference as client  # noqa: E402
+
+BUDGET = client.max_raw_bytes()
+
+
+def noise(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    return Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+
+
+def gradient(width, height):
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    rgb = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1).astype(np.uint8)
+    return Image.fromarray(rgb)
+
+
+def blocks(width, height, seed=1):
+    """Flat regions with sharp edges, closer to a photo than noise or a gradient"""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, (height // 40 + 1, width // 40 + 1, 3), dtype=np.uint8)
+    return Image.fromarray(small).resize((width, height), Image.Resampling.NEAREST)
+
+
+@pytest.mark.parametrize("img, max_bytes", [
+    (noise(640, 480), BUDGET),
+    (noise(1600, 1200, seed=3), BUDGET),
+    (noise(300, 1000, seed=4), 6000),
+    (gradient(2000, 1500), BUDGET),
+    (gradient(2000, 1500), 2000),
+    (blocks(3000, 2000), BUDGET),
+    (blocks(1200, 1600), 5000),
+])
+def test_fitted_image_is_never_over_budget(img, max_bytes):
+    data = client.fit_image(img, max_bytes)
+    assert len(data) <= max_bytes
+    decoded = Image.open(io.BytesIO(data))
+    assert decoded.format == "JPEG"
+    # Aspect ratio is kept
+    assert abs(decoded.width / decoded.height - img.width / img.height) < 0.05
+
+
+@pytest.mark.parametrize("width, height", [(640, 480), (1600, 1200)])
+def test_noise_fills_most_of_the_budget(width, height):
+    # Noise compresses far better once shrunk; the fit must still land near the budget
+    assert len(client.fit_image(noise(width, height), BUDGET)) >= 0.9 * BUDGET
+
+
+def test_image_that_fits_at_full_size_keeps_its_size():
+    img = gradient(320, 240)
+    data = client.fit_image(img, BUDGET)
+    assert len(data) <= BUDGET
+    assert Image.open(io.BytesIO(data)).size == img.size
+
+
+def test_budget_too_small_for_any_size_raises():
+    with pytest.raises(ValueError):
+        client.fit_image(noise(200, 200), 100)
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    directory = tmp_path / "cache"
+    monkeypatch.setattr(client, "PAYLOAD_CACHE_DIR", directory)
+    return directory
+
+
+def write_png(path, img):
+    img.save(path, "PNG")
+    assert path.stat().st_size > BUDGET
+    return path
+
+
+def test_cache_hit_returns_identical_bytes(tmp_path, cache_dir, monkeypatch):
+    path = write_png(tmp_path / "big.png", noise(1200, 900))
+
+    first = client.prepare_image(path)
+    assert first[2] is True
+    assert len(base64.b64decode(first[0])) <= BUDGET
+    assert len(list(cache_dir.glob("*.jpg"))) == 1
+
+    def no_refit(img, max_bytes):
+        raise AssertionError("cache hit should not re-fit the image")
+
+    monkeypatch.setattr(client, "fit_image", no_refit)
+    assert client.prepare_image(path) == first
+
+
+def test_uncached_fit_matches_cached_bytes(tmp_path, cache_dir):
+    path = write_png(tmp_path / "big.png", blocks(2400, 1800))
+    cached = client.prepare_image(path)
+    uncached = client.prepare_image(path, use_cache=False)
+    assert uncached == cached
+
+
+def test_cache_is_keyed_by_content(tmp_path, cache_dir):
+    first = client.prepare_image(write_png(tmp_path / "a.png", noise(1200, 900, seed=1)))
+    second = client.prepare_image(write_png(tmp_path / "b.png", noise(1200, 900, seed=2)))
+    assert first[0] != second[0]
+    assert len(list(cache_dir.glob("*.jpg"))) == 2
+
+
+def test_small_image_is_sent_unchanged(tmp_path, cache_dir):
+    path = tmp_path / "small.jpg"
+    gradient(320, 240).save(path, "JPEG", quality=80)
+    encoded, original_size, resized = client.prepare_image(path)
+    assert resized is False
+    assert base64.b64decode(encoded) == path.read_bytes()
+    assert original_size == path.stat().st_size
+    assert not cache_dir.exists()
@@ -0,0 +1,143 @@
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from test_sagemaker_inference import LatencyHistogram, ResultWriter, SummaryAggregator  # noqa: E402
+
+PERCENTILES = (1, 10, 50, 90, 95, 99, 99.9, 100)
+
+
+def exact(samples, p):
+    # Nearest-rank percentile, the definition the histogram approximates
+    return float(np.percentile(samples, p, method="inverted_cdf"))
+
+
+@pytest.mark.parametrize("samples", [
+    np.random.default_rng(0).lognormal(mean=4.5, sigma=0.8, size=20000),
+    np.random.default_rng(1).uniform(5, 3000, size=5000),
+    np.concatenate([np.full(990, 40.0), np.full(10, 9000.0)]),
+    np.array([123.4]),
+])
+def test_histogram_percentiles_within_precision_of_numpy(samples):
+    histogram = LatencyHistogram(precision=0.01)
+    for value in samples:
+        histogram.record(value)
+
+    assert histogram.count == len(samples)
+    assert histogram.max_ms == samples.max()
+    for p in PERCENTILES:
+        truth = exact(samples, p)
+        # The upper edge of the bucket: never below the true value, at most 1% above
+        assert truth <= histogram.percentile(p) <= truth * 1.01 + 1e-9
+
+
+def test_empty_histogram():
+    histogram = LatencyHistogram()
+    assert histogram.percentile(50) == 0.0
+    assert histogram.max_ms == 0.0
+
+
+def success(latency_ms, inference_ms, classes):
+    return {
+        "status": "success",
+        "total_latency_ms": latency_ms,
+        "metadata": {"inferenceTimeMs": inference_ms},
+        "detections": [{"className": name} for name in classes],
+    }
+
+
+def test_summary_matches_exact_statistics():
+    rng = np.random.default_rng(2)
+    latencies = rng.lognormal(mean=5.0, sigma=0.5, size=2000)
+    inference = latencies * 0.3
+    aggregator = SummaryAggregator()
+    for i, (latency, model_ms) in enumerate(zip(latencies, inference)):
+        aggregator.add(success(latency, model_ms, ["person"] * (i % 3) + ["chair"] * (i % 2)))
+    aggregator.add({"status": "failed", "error": "Timeout waiting for response"})
+    aggregator.add({"status": "failed", "error": "Timeout waiting for response"})
+    aggregator.add({"status": "failed", "error": "x" * 200})
+
+    summary = aggregator.summary()
+    assert summary["total_images"] == 2003
+    assert summary["successful"] == 2000
+    assert summary["failed"] == 3
+    assert summary["total_detections"] == sum(i % 3 + i % 2 for i in range(2000))
+    assert summary["class_counts"] == {"person": sum(i % 3 for i in range(2000)),
+                                       "chair": sum(i % 2 for i in range(2000))}
+    assert summary["average_total_latency_ms"] == int(latencies.sum() / 2000)
+    # Error messages are grouped, truncated to 80 characters
+    assert summary["errors"] == {"Timeout waiting for response": 2, "x" * 80: 1}
+
+    for key, samples in (("total_latency_percentiles_ms", latencies),
+                         ("inference_time_percentiles_ms", inference)):
+        reported = summary[key]
+        for name, p in (("p50", 50), ("p90", 90), ("p99", 99)):
+            truth = exact(samples, p)
+            assert truth - 0.05 <= reported[name] <= truth * 1.01 + 0.05
+        assert reported["max"] == round(samples.max(), 1)
+
+
+def test_summary_of_run_with_only_failures():
+    aggregator = SummaryAggregator()
+    aggregator.add({"status": "failed", "error": "Connection refused"})
+    summary = aggregator.summary()
+    assert summary["successful"] == 0
+    assert summary["average_total_latency_ms"] == 0
+    assert summary["average_detections_per_image"] == 0
+    assert summary["total_latency_percentiles_ms"] == {"p50": 0.0, "p90": 0.0, "p99": 0.0, "max": 0.0}
+    assert summary["errors"] == {"Connection refused": 1}
+
+
+def read_lines(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_writer_keeps_every_line_of_an_interrupted_run(tmp_path):
+    path = tmp_path / "results.jsonl"
+    writer = ResultWriter(path)
+    writer.write("a.jpg", success(120.0, 40.0, ["person"]), 120.0, 30.0, False)
+    writer.write("b.jpg", None, 0, 0, False, error="cannot identify image file")
+    # Not closed, as when the run is killed: each line is already flushed
+    lines = read_lines(path)
+    assert [line["image"] for line in lines] == ["a.jpg", "b.jpg"]
+    assert lines[0]["status"] == "success"
+    assert lines[1]["status"] == "failed"
+    assert lines[1]["error"] == "cannot identify image file"
+    writer.close()
+
+
+def test_failed_response_is_written_as_failure(tmp_path):
+    path = tmp_path / "results.jsonl"
+    writer = ResultWriter(path)
+    aggregator = SummaryAggregator()
+    backend_error = {"status": "error", "error": "Model error", "detections": [{"className": "cat"}]}
+    aggregator.add(writer.write("c.jpg", backend_error, 850.0, 12.5, True, "Model error"))
+    writer.close()
+
+    (line,) = read_lines(path)
+    assert line["status"] == "failed"
+    assert line["error"] == "Model error"
+    assert line["was_resized"] is True
+    # A failure does not leak the partial response into the record or the counts
+    assert "detections" not in line
+    summary = aggregator.summary()
+    assert summary["failed"] == 1
+    assert summary["total_detections"] == 0
+
+
+def test_writer_starts_each_run_with_a_fresh_file(tmp_path):
+    path = tmp_path / "results.jsonl"
+    writer = ResultWriter(path)
+    writer.write("old.jpg", None, 0, 0, False, error="old run")
+    writer.close()
+
+    writer = ResultWriter(path)
+    writer.write("new.jpg", success(50.0, 20.0, []), 50.0, 10.0, False)
+    writer.close()
+    assert [line["image"] for line in read_lines(path)] == ["new.jpg"]
@@ -0,0 +1,114 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "sagemaker"))
+
+from detections import Detections  # noqa: E402
+from tracking import Tracker  # noqa: E402
+
+
+def detections(boxes, scores, classes=None):
+    return Detections(
+        xyxy=np.array(boxes, dtype=np.float32).reshape(-1, 4),
+        class_ids=np.array(classes if classes is not None else [0] * len(scores), dtype=np.int64),
+        confidence=np.array(scores, dtype=np.float32),
+    )
+
+
+def box_at(x, y, size=40):
+    return [x, y, x + size, y + size]
+
+
+def ids_by_class(output):
+    return dict(zip(output.class_ids.tolist(), output.track_ids.tolist()))
+
+
+def test_ids_stay_stable_for_moving_objects():
+    tracker = Tracker(high_conf=0.5)
+    first = None
+    for frame in range(10):
+        # A person moving right and a car moving down, 5px per frame
+        output = tracker.update(detections(
+            [box_at(100 + 5 * frame, 100), box_at(300, 50 + 5 * frame, size=60)],
+            [0.9, 0.8],
+            classes=[0, 2],
+        ))
+        assert len(output) == 2
+        if first is None:
+            first = ids_by_class(output)
+        assert ids_by_class(output) == first
+    assert first[0] != first[2]
+
+
+def test_predicted_frames_follow_velocity_and_keep_ids():
+    tracker = Tracker(high_conf=0.5)
+    for frame in range(6):
+        output = tracker.update(detections([box_at(100 + 10 * frame, 100)], [0.9]))
+    track_id = output.track_ids[0]
+
+    predicted = tracker.predict()
+    assert predicted.track_ids.tolist() == [track_id]
+    # The box keeps moving right without a detection
+    assert predicted.xyxy[0, 0] > output.xyxy[0, 0] + 5
+
+    output = tracker.update(detections([box_at(170, 100)], [0.9]))
+    assert output.track_ids.tolist() == [track_id]
+
+
+def test_low_score_detection_continues_visible_track():
+    tracker = Tracker(high_conf=0.5)
+    output = tracker.update(detections([box_at(100, 100)], [0.9]))
+    track_id = output.track_ids[0]
+
+    # Partly occluded: the detector still finds it, but below high_conf
+    output = tracker.update(detections([box_at(102, 100)], [0.2]))
+    assert output.track_ids.tolist() == [track_id]
+    assert output.confidence[0] == np.float32(0.2)
+
+    output = tracker.update(detections([box_at(104, 100)], [0.9]))
+    assert output.track_ids.tolist() == [track_id]
+
+
+def test_low_score_detection_does_not_start_a_track():
+    tracker = Tracker(high_conf=0.5)
+    tracker.update(detections([box_at(100, 100)], [0.9]))
+    # An unrelated weak detection elsewhere is noise, not a new object
+    output = tracker.update(detections([box_at(102, 100), box_at(400, 400)], [0.9, 0.2]))
+    assert len(output) == 1
+    assert len(tracker.tracks) == 1
+
+
+def test_low_score_detection_does_not_revive_lost_track():
+    tracker = Tracker(high_conf=0.5)
+    output = tracker.update(detections([box_at(100, 100)], [0.9]))
+    track_id = output.track_ids[0]
+
+    assert len(tracker.update(detections([], []))) == 0
+    # Hidden tracks only come back through a confident detection
+    assert len(tracker.update(detections([box_at(100, 100)], [0.2]))) == 0
+    output = tracker.update(detections([box_at(100, 100)], [0.9]))
+    assert output.track_ids.tolist() == [track_id]
+
+
+def test_tracks_dropped_after_max_age():
+    tracker = Tracker(high_conf=0.5, max_age=3)
+    output = tracker.update(detections([box_at(100, 100)], [0.9]))
+    track_id = output.track_ids[0]
+
+    tracker.update(detections([], []))
+    assert len(tracker.predict()) == 0
+    # Third frame without a match: still within max_age, so it can come back
+    output = tracker.update(detections([box_at(100, 100)], [0.9]))
+    assert output.track_ids.tolist() == [track_id]
+
+    tracker.update(detections([], []))
+    for _ in range(2):
+        tracker.predict()
+    assert len(tracker.tracks) == 1
+    # Fourth frame without a match: past max_age, so the next object is a new track
+    tracker.predict()
+    assert tracker.tracks == []
+    output = tracker.update(detections([box_at(100, 100)], [0.9]))
+    assert output.track_ids.tolist() == [track_id + 1]